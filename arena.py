@@ -0,0 +1,267 @@
+import argparse
+import math
+import multiprocessing as mp
+import queue
+import time
+
+import board as bd
+import worker_pool
+
+
+# Play games between a candidate and a reference network, each one in its
+# own UctTree, to decide if the candidate is stronger.
+#
+# Games are played in worker processes with alternating colours, and a
+# sequential probability ratio test stops the match as soon as the result
+# is clear: H0 is the candidate is 'elo0' stronger, H1 is it is 'elo1'
+# stronger, with error rates 'alpha' and 'beta'.
+
+
+# Score of a player 'elo' stronger, 1 is a win and 0.5 a tie.
+def elo_to_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400.0))
+
+
+def score_to_elo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+# Return [score, variance of one game] of 'wins', 'ties' and 'losses'.
+def _score(wins, ties, losses):
+    games = wins + ties + losses
+    score = (wins + 0.5 * ties) / games
+    variance = (wins * (1 - score) ** 2 + ties * (0.5 - score) ** 2 +
+                losses * score ** 2) / games
+    return score, variance
+
+
+# Return [elo, error] of the result, error is the half width of the 95%
+# confidence interval.
+def elo_difference(wins, ties, losses):
+    games = wins + ties + losses
+    score, variance = _score(wins, ties, losses)
+    error = 1.96 * math.sqrt(variance / games)
+    low = score_to_elo(score - error)
+    high = score_to_elo(score + error)
+    return score_to_elo(score), (high - low) / 2
+
+
+# Log likelihood ratio of H1 against H0, by the normal approximation of
+# the mean score. One pseudo win and one pseudo loss are added, so the
+# variance of one sided results like all wins or all ties is not 0 and
+# the ratio grows with the games.
+def log_likelihood_ratio(wins, ties, losses, elo0, elo1):
+    if wins + ties + losses == 0:
+        return 0.0
+    wins += 1
+    losses += 1
+    games = wins + ties + losses
+    score, variance = _score(wins, ties, losses)
+    score0 = elo_to_score(elo0)
+    score1 = elo_to_score(elo1)
+    return (games * (score1 - score0) * (2 * score - score0 - score1) /
+            (2 * variance))
+
+
+# Return [lower, upper] bounds of the ratio, H0 is accepted below 'lower'
+# and H1 above 'upper'.
+def sprt_bounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+# Play one game between 'trees', {colour: UctTree}, from the empty board.
+# Every move is searched by the tree of the side to move, both trees play
+# it. The first 'random_moves' moves are sampled by visit count so games
+# differ from each other.
+# Return [winner, moves], or None if 'stop_event' is set.
+def play_match(trees, playouts, batch_size=1, random_moves=0,
+               stop_event=None, seconds=None):
+    for tree in trees.values():
+        tree.restart()
+    board = bd.Board()
+    moves = 0
+    while True:
+        if stop_event is not None and stop_event.is_set():
+            return None
+
+        color = board.who_turn()
+        tree = trees[color]
+        tree.mcts_visit(playouts, batch_size, seconds)
+        if moves < random_moves:
+            row, col = tree.sample_move()
+        else:
+            row, col = tree.get_best_move(verbose=False)
+
+        status = board.play(row, col)
+        for each in trees.values():
+            each.play(row, col)
+        moves += 1
+        if status != bd.Board.NOTHING:
+            winner = color if status == bd.Board.WIN else bd.Board.EMPTY
+            return winner, moves
+
+
+def _make_tree(args, net):
+    import uct_tree
+    return uct_tree.UctTree(net, network_threads=args.threads,
+                            use_tactics=not args.no_tactics)
+
+
+# Worker process, plays the game of every index from 'task_queue', the
+# candidate is black in even games. Results are sent to 'result_queue'.
+def _worker(worker_id, task_queue, result_queue, stop_event, args):
+    import numpy as np
+
+    np.random.seed((args.seed * 7919 + worker_id) % (2 ** 32))
+    candidate = _make_tree(args, args.candidate)
+    reference = _make_tree(args, args.reference)
+    while not stop_event.is_set():
+        try:
+            index = task_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if index is None:
+            break
+
+        if index % 2 == 0:
+            color = bd.Board.BLACK
+            trees = {bd.Board.BLACK: candidate, bd.Board.WHITE: reference}
+        else:
+            color = bd.Board.WHITE
+            trees = {bd.Board.BLACK: reference, bd.Board.WHITE: candidate}
+        result = play_match(trees, args.playouts, args.batch_size,
+                            args.random_moves, stop_event, args.seconds)
+        if result is not None:
+            result_queue.put((index, color) + result)
+
+
+class Match(object):
+    # Results of the candidate so far, and the SPRT decision.
+    def __init__(self, elo0, elo1, alpha, beta, min_games):
+        self.wins = 0
+        self.ties = 0
+        self.losses = 0
+        self._elo0 = elo0
+        self._elo1 = elo1
+        self._bounds = sprt_bounds(alpha, beta)
+        self._min_games = min_games
+
+    def games(self):
+        return self.wins + self.ties + self.losses
+
+    def add(self, candidate_color, winner):
+        if winner == bd.Board.EMPTY:
+            self.ties += 1
+        elif winner == candidate_color:
+            self.wins += 1
+        else:
+            self.losses += 1
+
+    def llr(self):
+        return log_likelihood_ratio(self.wins, self.ties, self.losses,
+                                    self._elo0, self._elo1)
+
+    # Return 'H1' if the candidate is stronger, 'H0' if not, or None if
+    # not decided yet.
+    def decision(self):
+        if self.games() < self._min_games:
+            return None
+        llr = self.llr()
+        if llr <= self._bounds[0]:
+            return 'H0'
+        if llr >= self._bounds[1]:
+            return 'H1'
+        return None
+
+    def summary(self):
+        score, _ = _score(self.wins, self.ties, self.losses)
+        elo, error = elo_difference(self.wins, self.ties, self.losses)
+        return ('+{} ={} -{}, score: {:.3f}, elo: {:+.1f} +/- {:.1f}, '
+                'llr: {:.2f} [{:.2f}, {:.2f}]'.format(
+                    self.wins, self.ties, self.losses, score, elo, error,
+                    self.llr(), *self._bounds))
+
+
+# Play the match in 'args.workers' processes until 'args.games' games
+# are played or the SPRT decides. Return the 'Match'.
+def run_arena(args):
+    pool = worker_pool.WorkerPool(_worker, args.workers, args)
+    for index in range(args.games):
+        pool.task_queue.put(index)
+    pool.start()
+    pool.finish()
+
+    match = Match(args.elo0, args.elo1, args.alpha, args.beta,
+                  args.min_games)
+    start = time.time()
+    decision = None
+    try:
+        for result in pool.results():
+            index, color, winner, moves = result
+            match.add(color, winner)
+            print('game {}: candidate {}, {}, moves: {}, {}'.format(
+                index, 'black' if color == bd.Board.BLACK else 'white',
+                'tie' if winner == bd.Board.EMPTY else
+                'win' if winner == color else 'loss', moves,
+                match.summary()))
+            decision = match.decision()
+            if decision is not None:
+                break
+    except KeyboardInterrupt:
+        print('Stopping workers ...')
+    finally:
+        # Games in progress are dropped.
+        pool.close()
+
+    elapsed = time.time() - start
+    print('Finish {} games in {:.1f}s, games/min: {:.1f}'.format(
+        match.games(), elapsed,
+        match.games() * 60.0 / elapsed if elapsed > 0 else 0.0))
+    if match.games() > 0:
+        print(match.summary())
+    print({'H1': 'SPRT: candidate is stronger',
+           'H0': 'SPRT: candidate is not stronger'}.get(
+               decision, 'SPRT: not decided'))
+    return match
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--candidate', required=True,
+                        help="checkpoint, exported '.pb' or '.npz' network")
+    parser.add_argument('--reference', default='net/nn',
+                        help="checkpoint, exported '.pb' or '.npz' network")
+    parser.add_argument('--games', type=int, default=400,
+                        help='most games to play')
+    parser.add_argument('--playouts', type=int, default=400,
+                        help='playouts per move, 0 for no limit')
+    parser.add_argument('--seconds', type=float, default=None,
+                        help='search time per move')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--random-moves', type=int, default=4,
+                        help='number of opening moves sampled by visits')
+    parser.add_argument('--workers', type=int, default=mp.cpu_count())
+    parser.add_argument('--threads', type=int, default=1,
+                        help='TF threads per network')
+    parser.add_argument('--no-tactics', action='store_true',
+                        help='search without the tactical solver')
+    parser.add_argument('--elo0', type=float, default=0.0,
+                        help='elo of the candidate under H0')
+    parser.add_argument('--elo1', type=float, default=35.0,
+                        help='elo of the candidate under H1')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--min-games', type=int, default=10,
+                        help='games before the SPRT may stop the match')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.playouts <= 0:
+        if args.seconds is None:
+            parser.error('--playouts 0 needs --seconds')
+        args.playouts = None
+    run_arena(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import board as bd  # noqa: E402
+
+
+# The per-cell scan 'Board._check_win' used before bitboards,
+# kept here as the reference implementation.
+def _scan_check_win(grid, row, col):
+    check_color = grid[row][col]
+    for row_dir, col_dir in bd.Board.DIR_4:
+        count = 0
+        for d in range(2):
+            for offset in range(1, 5):
+                cur_row = row + (row_dir if d == 0 else -row_dir) * offset
+                cur_col = col + (col_dir if d == 0 else -col_dir) * offset
+                if (cur_row < 0 or cur_row > 14 or
+                        cur_col < 0 or cur_col > 14):
+                    break
+                if grid[cur_row][cur_col] != check_color:
+                    break
+                count += 1
+        if count >= 4:
+            return bd.Board.WIN
+    return bd.Board.NOTHING
+
+
+# Random move sequences, each one is played until someone wins.
+def _random_games(games, seed):
+    rand = random.Random(seed)
+    sequences = []
+    for _ in range(games):
+        moves = [(row, col) for row in range(15) for col in range(15)]
+        rand.shuffle(moves)
+        board = bd.Board()
+        for idx, (row, col) in enumerate(moves):
+            if board.play(row, col) != bd.Board.NOTHING:
+                break
+        sequences.append(moves[:idx + 1])
+    return sequences
+
+
+def _run_scan(sequences):
+    results = []
+    for moves in sequences:
+        grid = [[bd.Board.EMPTY] * 15 for _ in range(15)]
+        for idx, (row, col) in enumerate(moves):
+            grid[row][col] = bd.Board.BLACK if idx % 2 == 0 else bd.Board.WHITE
+            results.append(_scan_check_win(grid, row, col))
+        for row, col in reversed(moves):
+            grid[row][col] = bd.Board.EMPTY
+    return results
+
+
+def _run_bitboard(sequences):
+    results = []
+    board = bd.Board()
+    for moves in sequences:
+        for row, col in moves:
+            results.append(board.play(row, col))
+        for row, col in reversed(moves):
+            board.undo(row, col)
+    return results
+
+
+# Win check alone on every stone of the final positions.
+def _check_only(sequences, check):
+    results = []
+    for board, grid, moves in sequences:
+        for row, col in moves:
+            results.append(check(board, grid, row, col))
+    return results
+
+
+def _best_time(func, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func(arg)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+# Compare the bitboard 'Board.play'/'undo' with the old per-cell scan.
+# The scan side places and removes the same stones on a plain list
+# board, so it has no bookkeeping besides the win check.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    sequences = _random_games(args.games, args.seed)
+    moves = sum(len(m) for m in sequences)
+
+    scan, scan_time = _best_time(_run_scan, sequences, args.repeat)
+    bitboard, bitboard_time = _best_time(_run_bitboard, sequences,
+                                         args.repeat)
+    assert scan == bitboard, 'win detection mismatch'
+
+    positions = []
+    for moves_seq in sequences:
+        board = bd.Board()
+        for row, col in moves_seq:
+            board.play(row, col)
+        positions.append((board, board._board.tolist(), moves_seq))
+    scan_check, scan_check_time = _best_time(
+        lambda p: _check_only(p, lambda b, g, r, c: _scan_check_win(g, r, c)),
+        positions, args.repeat)
+    bit_check, bit_check_time = _best_time(
+        lambda p: _check_only(p, lambda b, g, r, c: b._check_win(r, c)),
+        positions, args.repeat)
+    assert scan_check == bit_check, 'win detection mismatch'
+
+    print('moves: {}'.format(moves))
+    print('play + undo, list board + per-cell scan: {:.0f} moves/s'
+          .format(moves / scan_time))
+    print('play + undo, Board with bitboards:      {:.0f} moves/s'
+          .format(moves / bitboard_time))
+    print('win check only, per-cell scan:          {:.0f} checks/s'
+          .format(len(scan_check) / scan_check_time))
+    print('win check only, bitboards:              {:.0f} checks/s'
+          .format(len(bit_check) / bit_check_time))
+
+
+if __name__ == '__main__':
+    main()
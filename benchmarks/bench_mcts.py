@@ -0,0 +1,40 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import uct_tree  # noqa: E402
+
+
+# Measure MCTS playouts per second for several leaf batch sizes.
+# Every batch size searches from the empty board with a fresh tree and
+# an empty transposition table, so the numbers are comparable.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--net', default=None,
+                        help='network path, random weights if not given')
+    parser.add_argument('--playouts', type=int, default=800)
+    parser.add_argument('--batch-sizes', default='1,4,8,16,32')
+    parser.add_argument('--near-distance', type=int, default=None)
+    parser.add_argument('--top-k', type=int, default=None)
+    parser.add_argument('--top-p', type=float, default=None)
+    args = parser.parse_args()
+
+    tree = uct_tree.UctTree(args.net, near_distance=args.near_distance,
+                            top_k=args.top_k, top_p=args.top_p)
+    for batch_size in [int(x) for x in args.batch_sizes.split(',')]:
+        tree.clear_tt()
+        tree.restart()
+        start = time.time()
+        tree.mcts_visit(args.playouts, batch_size=batch_size)
+        elapsed = time.time() - start
+        print('batch size: {:>4}, playouts: {}, time: {:.2f}s, '
+              'playouts/s: {:.1f}, nodes: {}'.format(
+                  batch_size, args.playouts, elapsed,
+                  args.playouts / elapsed, tree.get_node_count()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import board as bd  # noqa: E402
+import uct_tree  # noqa: E402
+
+
+# Measure memory of expanded tree nodes in bytes per node.
+# Nodes are expanded with random policies on random positions, so no
+# network is needed and only the node storage is measured.
+# With '--near-distance', children are pruned as 'UctTree' does.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=2000)
+    parser.add_argument('--positions', type=int, default=50)
+    parser.add_argument('--max-stones', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--near-distance', type=int, default=None)
+    parser.add_argument('--clustered', action='store_true',
+                        help='play next to the stones, as in real games')
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    rng = np.random.RandomState(args.seed)
+    legal_points = []
+    for _ in range(args.positions):
+        board = bd.Board(args.near_distance or 2)
+        moves = bd.Board(1)
+        for _ in range(rand.randint(0, args.max_stones)):
+            if args.clustered:
+                point = int(rand.choice(moves.candidate_points()))
+                move = divmod(point, bd.Board.BOARD_DIMEN)
+            else:
+                move = rand.choice(board.legal_moves())
+            board.play(*move)
+            moves.play(*move)
+        legal_points.append(board.legal_points()
+                            if args.near_distance is None
+                            else board.candidate_points())
+    policies = [rng.dirichlet(np.ones(226)).astype(np.float32)
+                for _ in range(args.positions)]
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    nodes = []
+    for i in range(args.nodes):
+        node = uct_tree.Node(1, 7, 7, 0.1, 0.0, None)
+        node.create_children(policies[i % args.positions],
+                             legal_points[i % args.positions])
+        nodes.append(node)
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    print('nodes: {}, children/node: {:.1f}, bytes/node: {:.0f}'.format(
+        len(nodes), np.mean([len(node._child_moves) for node in nodes]),
+        used / len(nodes)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import parallel_search  # noqa: E402
+import uct_tree  # noqa: E402
+from suite import load_positions  # noqa: E402
+
+
+# Search every position with 'search(tree)' from an empty transposition
+# table, and return [playouts/s, most visited points]. Ties go to the
+# lowest point for every kind of search, the visits of random weights
+# are nearly flat.
+def _run(tree, positions, search):
+    playouts = 0
+    seconds = 0.0
+    moves = []
+    for position in positions:
+        tree.clear_tt()
+        tree.restart()
+        for row, col in position:
+            tree.play(row, col)
+        stats = search(tree)
+        playouts += stats['playouts']
+        seconds += stats['seconds']
+        moves.append(int(np.argmax(tree.get_visits())))
+    return playouts / seconds, moves
+
+
+def _report(name, count, speed, moves, reference, base_speed):
+    agree = sum(a == b for a, b in zip(moves, reference)) / len(reference)
+    print('{:<14} {:>3}: playouts/s: {:>8.1f}, scaling: {:>5.2f}, '
+          'agreement: {:.0%}'.format(name, count, speed, speed / base_speed,
+                                      agree))
+
+
+# Playout scaling of the shared tree with several threads and of the
+# root parallel search with several processes, and how often they pick
+# the move of the single threaded search with the same time per move.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--net', default=None,
+                        help='network of every search, seeded random '
+                             'weights if not given')
+    parser.add_argument('--seconds', type=float, default=2.0,
+                        help='search time per position')
+    parser.add_argument('--batch-size', type=int, default=8,
+                        help='leaf batch size of the single threaded and '
+                             'root parallel searches')
+    parser.add_argument('--threads', default='1,2,4,8')
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--positions', type=int, default=8)
+    parser.add_argument('--stones', type=int, default=8,
+                        help='stones of every stored position to search')
+    args = parser.parse_args()
+
+    positions = [moves[:args.stones]
+                 for moves in load_positions()[:args.positions]]
+    tree = uct_tree.UctTree(args.net)
+    base_speed, reference = _run(
+        tree, positions,
+        lambda t: t.mcts_visit(None, args.batch_size, args.seconds))
+    _report('single', 1, base_speed, reference, reference, base_speed)
+
+    for threads in [int(x) for x in args.threads.split(',')]:
+        speed, moves = _run(
+            tree, positions,
+            lambda t: t.mcts_visit_threaded(None, threads, args.seconds))
+        _report('tree parallel', threads, speed, moves, reference,
+                base_speed)
+
+    for workers in [int(x) for x in args.workers.split(',')]:
+        root = parallel_search.RootParallelTree(args.net, workers)
+        try:
+            speed, moves = _run(
+                root, positions,
+                lambda t: t.mcts_visit(None, args.batch_size, args.seconds))
+        finally:
+            root.close()
+        _report('root parallel', workers, speed, moves, reference,
+                base_speed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import board as bd  # noqa: E402
+import uct_tree  # noqa: E402
+from suite import load_positions  # noqa: E402
+
+
+# Play from the first 'stones' stones of each stored position, with a
+# tree searching 'seconds' per move against an opponent tree of the same
+# network, so the reused playouts come from pondering only. The
+# opponent picks its move first, then its thinking time 'think' is
+# waited, with or without pondering.
+# Return [root visits at every move, pondered playouts, visits of the
+# root before every search].
+def _play(args, positions, ponder):
+    tree = uct_tree.UctTree(args.net, near_distance=args.near_distance)
+    opponent = uct_tree.UctTree(args.net, near_distance=args.near_distance)
+    visits = []
+    pondered = []
+    reused = []
+    for moves in positions[:args.positions]:
+        tree.restart()
+        opponent.restart()
+        for row, col in moves[:args.stones]:
+            tree.play(row, col)
+            opponent.play(row, col)
+        for _ in range(args.moves):
+            stats = tree.mcts_visit(None, args.batch_size, args.seconds)
+            visits.append(stats['root_visits'])
+            row, col = tree.get_best_move(verbose=False)
+            if tree.play(row, col) != bd.Board.NOTHING:
+                break
+            opponent.play(row, col)
+
+            opponent.mcts_visit(args.opponent_playouts, args.batch_size)
+            row, col = opponent.get_best_move(verbose=False)
+            if ponder:
+                tree.start_pondering(args.batch_size)
+            time.sleep(args.think)
+            if ponder:
+                pondered.append(tree.stop_pondering()['playouts'])
+            if opponent.play(row, col) != bd.Board.NOTHING:
+                break
+            tree.play(row, col)
+            # Playouts already behind the next move.
+            reused.append(tree._cur_node._visit_count)
+    return visits, pondered, reused
+
+
+# Compare the playouts behind every move with and without pondering on
+# the opponent's time. Searches are in this process, so the opponent's
+# thinking is a sleep while the pondering thread runs.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--net', default=None,
+                        help='network of both trees, seeded random weights '
+                             'if not given')
+    parser.add_argument('--seconds', type=float, default=0.5,
+                        help='search time per move')
+    parser.add_argument('--think', type=float, default=0.5,
+                        help="opponent's thinking time per move")
+    parser.add_argument('--opponent-playouts', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--positions', type=int, default=4)
+    parser.add_argument('--stones', type=int, default=6,
+                        help='stones of every stored position to start')
+    parser.add_argument('--moves', type=int, default=6,
+                        help='own moves played from every position')
+    parser.add_argument('--near-distance', type=int, default=None)
+    args = parser.parse_args()
+
+    positions = load_positions()
+    for ponder in (False, True):
+        visits, pondered, reused = _play(args, positions, ponder)
+        print('pondering: {:<5}, moves: {}, playouts/move: {:.0f}, '
+              'reused/move: {:.0f}'.format(
+                  str(ponder), len(visits), np.mean(visits),
+                  np.mean(reused)), end='')
+        if ponder:
+            print(', pondered/move: {:.0f}'.format(np.mean(pondered)),
+                  end='')
+        print()
+
+
+if __name__ == '__main__':
+    main()
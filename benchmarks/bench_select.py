@@ -0,0 +1,104 @@
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import board as bd  # noqa: E402
+import uct_tree  # noqa: E402
+
+
+# Child selection as a Python loop over the children, as it was done
+# before the child statistics were stored in arrays. Same formula as
+# 'Node.select_child', kept here as the reference implementation.
+def _loop_select(node, c_puct):
+    best = -1
+    best_value = 0.0
+    explore = c_puct * math.sqrt(max(node._visit_count, 1))
+    children = node._children
+    for idx, child_policy in enumerate(node._child_priors.tolist()):
+        child = children.get(idx)
+        if child is not None and child._visit_count > 0:
+            win_rate = child._get_win_rate()
+            child_visit = child._visit_count
+        else:
+            win_rate = 1 - node._nn_value
+            child_visit = 0
+        value = win_rate + explore * child_policy / (1 + child_visit)
+        if value > best_value:
+            best_value = value
+            best = idx
+    return best
+
+
+# Nodes on random positions, with random visits on some children.
+# Children are pruned to 'near_distance' if it is given.
+def _random_nodes(count, seed, near_distance=None):
+    rand = random.Random(seed)
+    rng = np.random.RandomState(seed)
+    nodes = []
+    for _ in range(count):
+        board = bd.Board(near_distance or 2)
+        for _ in range(rand.randint(1, 40)):
+            board.play(*rand.choice(board.legal_moves()))
+        node = uct_tree.Node(0, -1, -1, 0.0, rand.uniform(-1, 1), None)
+        node.create_children(rng.dirichlet(np.ones(226)),
+                             board.legal_points() if near_distance is None
+                             else board.candidate_points())
+        node._visit_count = 1
+        visited = min(20, len(node._child_moves))
+        for idx in rng.choice(len(node._child_moves), visited,
+                              replace=False):
+            row, col = node.child_move(idx)
+            child = uct_tree.Node(1, row, col,
+                                  float(node._child_priors[idx]),
+                                  rand.uniform(-1, 1), node, int(idx))
+            node._children[int(idx)] = child
+            for _ in range(rand.randint(0, 50)):
+                child.update(rand.uniform(-1, 1))
+                node._visit_count += 1
+        nodes.append(node)
+    return nodes
+
+
+def _selections_per_second(nodes, select, c_puct, seconds):
+    count = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        for node in nodes:
+            select(node, c_puct)
+        count += len(nodes)
+    return count / (time.time() - start)
+
+
+# Compare vectorized PUCT selection with the Python loop.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=100)
+    parser.add_argument('--c-puct', type=float, default=1.0)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--near-distance', type=int, default=None)
+    args = parser.parse_args()
+
+    nodes = _random_nodes(args.nodes, args.seed, args.near_distance)
+    for node in nodes:
+        assert (node.select_child(args.c_puct) ==
+                _loop_select(node, args.c_puct)), 'selection mismatch'
+
+    loop = _selections_per_second(nodes, _loop_select, args.c_puct,
+                                  args.seconds)
+    vector = _selections_per_second(
+        nodes, lambda node, c_puct: node.select_child(c_puct),
+        args.c_puct, args.seconds)
+    print('python loop: {:.0f} selections/s'.format(loop))
+    print('vectorized:  {:.0f} selections/s'.format(vector))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import board as bd  # noqa: E402
+import tactics  # noqa: E402
+import uct_tree  # noqa: E402
+
+
+# Benchmark suite of the board, the network and the search.
+#
+# Every benchmark runs on the stored positions in 'positions.json' with
+# fixed seeds, so two runs on the same machine do the same work. The
+# results are written as JSON:
+#   {'meta': {...}, 'results': {name: {'value', 'unit', 'higher'}}}
+# 'higher' is True if a higher value is better. A result file can be
+# given as '--baseline' of a later run, results which are worse than the
+# baseline by more than '--tolerance' are flagged and the exit status
+# is 1. Use the same '--net' for runs which are compared, the search
+# depends on the network. Without '--net' the random weights are seeded
+# by 'uct_tree.RANDOM_NET_SEED', which is recorded in 'meta'.
+POSITIONS_PATH = os.path.join(os.path.dirname(__file__), 'positions.json')
+BENCHMARKS = ('board', 'encode', 'eval', 'mcts', 'memory')
+
+
+# Return True if the search of 'board' is not decided by tactics: no
+# side has a four, and the side to move has no forced win or reply.
+def _is_open(board):
+    if any(tactics.five_points(board, color)
+           for color in (bd.Board.BLACK, bd.Board.WHITE)):
+        return False
+    return tactics.analyse(board) == (bd.Board.NOTHING, None)
+
+
+# Return 'count' move lists of games played next to the stones, between
+# 'min_stones' and 'max_stones'. Positions which are won or decided by
+# tactics are skipped, the search would only revisit proven leaves.
+def make_positions(count, seed, min_stones=6, max_stones=60):
+    rand = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = bd.Board(1)
+        moves = []
+        for _ in range(rand.randint(min_stones, max_stones)):
+            row, col = divmod(int(rand.choice(board.candidate_points())),
+                              bd.Board.BOARD_DIMEN)
+            if board.play(row, col) != bd.Board.NOTHING:
+                break
+            moves.append([row, col])
+        else:
+            if _is_open(board):
+                positions.append(moves)
+    return positions
+
+
+def load_positions(path=POSITIONS_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _boards(positions, near_distance=2):
+    boards = []
+    for moves in positions:
+        board = bd.Board(near_distance)
+        for row, col in moves:
+            board.play(row, col)
+        boards.append(board)
+    return boards
+
+
+def _seed(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+# Return the shortest time of 'repeat' calls of 'func'.
+def _best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _result(value, unit, higher=True):
+    return {'value': value, 'unit': unit, 'higher': higher}
+
+
+# 'Board.play' and 'undo' of every stored game, and '_check_win' on
+# every stone of the final positions.
+def bench_board(args, positions):
+    board = bd.Board()
+
+    def play_undo():
+        for moves in positions:
+            for row, col in moves:
+                board.play(row, col)
+            for row, col in reversed(moves):
+                board.undo(row, col)
+
+    stones = sum(len(moves) for moves in positions)
+    play_time = _best_time(play_undo, args.repeat)
+    boards = _boards(positions)
+
+    def check_win():
+        for final, moves in zip(boards, positions):
+            for row, col in moves:
+                final._check_win(row, col)
+
+    check_time = _best_time(check_win, args.repeat)
+    return {'board.play_undo': _result(2 * stones / play_time, 'ops/s'),
+            'board.check_win': _result(stones / check_time, 'ops/s')}
+
+
+def bench_encode(args, positions):
+    boards = _boards(positions)
+    out = np.empty((bd.Board.BOARD_DIMEN, bd.Board.BOARD_DIMEN, 5),
+                   dtype=np.float32)
+
+    def encode():
+        for _ in range(10):
+            for board in boards:
+                board.get_data_for_network(out=out)
+
+    elapsed = _best_time(encode, args.repeat)
+    return {'encode': _result(10 * len(boards) / elapsed, 'positions/s')}
+
+
+# Positions per second of 'evaluate' for every batch size.
+def bench_eval(args, positions):
+    network = uct_tree._load_network(args.net)
+    data = np.stack([board.get_data_for_network()
+                     for board in _boards(positions)])
+    results = {}
+    for batch_size in args.batch_sizes:
+        batch = data[np.arange(batch_size) % len(data)]
+        network.evaluate(batch)
+        calls = max(1, 64 // batch_size)
+
+        def evaluate():
+            for _ in range(calls):
+                network.evaluate(batch)
+
+        elapsed = _best_time(evaluate, args.repeat)
+        results['eval.batch_{}'.format(batch_size)] = _result(
+            calls * batch_size / elapsed, 'positions/s')
+    return results
+
+
+# Playouts per second from the first 'mcts_positions' positions, with a
+# fresh tree and an empty transposition table for each.
+def bench_mcts(args, positions):
+    tree = uct_tree.UctTree(args.net)
+    playouts = 0
+    elapsed = 0.0
+    for moves in positions[:args.mcts_positions]:
+        tree.clear_tt()
+        tree.restart()
+        for row, col in moves:
+            tree.play(row, col)
+        stats = tree.mcts_visit(args.playouts, batch_size=args.batch_size)
+        playouts += stats['playouts']
+        elapsed += stats['seconds']
+    return {'mcts.playouts': _result(playouts / elapsed, 'playouts/s')}
+
+
+# Return the peak RSS of this process in bytes. 'ru_maxrss' of a new
+# process starts at the peak of its parent on Linux, so the peak of the
+# own memory map is read from '/proc' if it exists.
+def _peak_rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# Build a tree of 'nodes' nodes expanded with random priors, every node
+# is a child of a random earlier one. Return the growth of the peak RSS
+# in bytes, so it must run in a fresh process.
+def _tree_peak_rss(positions, nodes, seed):
+    _seed(seed)
+    rng = np.random.RandomState(seed)
+    legal_points = [board.legal_points() for board in _boards(positions)]
+    policies = [rng.dirichlet(np.ones(bd.Board.PASS_POINT + 1))
+                .astype(np.float32) for _ in positions]
+    before = _peak_rss()
+    tree = []
+    for i in range(nodes):
+        parent = None
+        index = -1
+        if tree:
+            parent = tree[rng.randint(len(tree))]
+            index = int(rng.randint(len(parent._child_moves)))
+        node = uct_tree.Node(1, 7, 7, 0.1, 0.0, parent, index)
+        node.create_children(policies[i % len(positions)],
+                             legal_points[i % len(positions)])
+        if parent is not None:
+            parent._children[index] = node
+        tree.append(node)
+    return _peak_rss() - before
+
+
+def bench_memory(args, positions):
+    ctx = mp.get_context('spawn')
+    with ctx.Pool(1) as pool:
+        peak = pool.apply(_tree_peak_rss,
+                          (positions, args.memory_nodes, args.seed))
+    return {'memory.peak_rss_10k_nodes': _result(
+        peak * 10000.0 / args.memory_nodes / 2 ** 20, 'MiB', higher=False)}
+
+
+# Return the names of the results worse than 'baseline' by more than
+# 'tolerance', e.g. 0.15 is 15%, and print the comparison.
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None or base['value'] == 0:
+            print('{:<32} {:>14.1f} {}'.format(name, result['value'],
+                                               result['unit']))
+            continue
+        change = result['value'] / base['value'] - 1
+        worse = -change if result['higher'] else change
+        flag = ''
+        if worse > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{:<32} {:>14.1f} {:<12} {:>+7.1%} vs {:.1f}{}'.format(
+            name, result['value'], result['unit'], change, base['value'],
+            flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--net', default=None,
+                        help='network path, seeded random weights if not '
+                             'given')
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help='comma separated benchmarks to run')
+    parser.add_argument('--output', default=None,
+                        help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None,
+                        help='compare with the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='flag results worse than the baseline by '
+                             'more than this ratio')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='best time of this many runs is used')
+    parser.add_argument('--batch-sizes', default='1,2,4,8,16,32,64,128,256')
+    parser.add_argument('--playouts', type=int, default=400)
+    parser.add_argument('--batch-size', type=int, default=8,
+                        help='leaf batch size of the search')
+    parser.add_argument('--mcts-positions', type=int, default=4)
+    parser.add_argument('--memory-nodes', type=int, default=10000)
+    parser.add_argument('--positions', default=POSITIONS_PATH)
+    parser.add_argument('--make-positions', type=int, default=0,
+                        help='write this many new positions made with '
+                             "'--seed' to '--positions' and exit")
+    args = parser.parse_args()
+    args.batch_sizes = [int(x) for x in args.batch_sizes.split(',')]
+
+    if args.make_positions > 0:
+        with open(args.positions, 'w') as f:
+            json.dump(make_positions(args.make_positions, args.seed), f)
+        return
+
+    positions = load_positions(args.positions)
+    benchmarks = {'board': bench_board, 'encode': bench_encode,
+                  'eval': bench_eval, 'mcts': bench_mcts,
+                  'memory': bench_memory}
+    results = {}
+    for name in args.only.split(','):
+        _seed(args.seed)
+        results.update(benchmarks[name](args, positions))
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.output is not None:
+        meta = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.platform(),
+                'net': args.net, 'seed': args.seed,
+                'net_seed': (uct_tree.RANDOM_NET_SEED if args.net is None
+                             else None),
+                'positions': len(positions)}
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2,
+                      sort_keys=True)
+    if regressions:
+        print('regressions: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,88 @@
+import numpy as np
+import random
+
+
+# Line id and position in the line of every point, for each direction
+# in 'Board.DIR_4'. Lines of the same direction have continuous ids.
+def _build_line_index(dimen):
+    lines = 2 * dimen - 1
+    index = []
+    for row in range(dimen):
+        for col in range(dimen):
+            index.append(((row, col),
+                          (lines + col, row),
+                          (2 * lines + col - row + dimen - 1, row),
+                          (3 * lines + row + col, row)))
+    return index
+
+
+# Point of every position of every line, -1 where the line has no point,
+# the reverse of '_build_line_index'.
+def _build_line_points(dimen, line_index):
+    points = [[-1] * dimen for _ in range(4 * (2 * dimen - 1))]
+    for point, index in enumerate(line_index):
+        for line_id, pos in index:
+            points[line_id][pos] = point
+    return points
+
+
+# Points at most 'distance' rows and columns away from every point,
+# as a bit mask of points.
+def _build_near_masks(dimen, distance):
+    masks = []
+    for row in range(dimen):
+        for col in range(dimen):
+            mask = 0
+            for r in range(max(0, row - distance),
+                           min(dimen, row + distance + 1)):
+                for c in range(max(0, col - distance),
+                               min(dimen, col + distance + 1)):
+                    mask |= 1 << (r * dimen + c)
+            masks.append(mask)
+    return masks
+
+
+# Random 64 bits keys of every [colour][point] for zobrist hashing.
+# The seed is fixed so the hash of a position is the same in every process.
+def _build_zobrist(dimen, seed=20180715):
+    rand = random.Random(seed)
+    return [[rand.getrandbits(64) for _ in range(dimen * dimen)]
+            for _ in range(3)]
+
+
+# The 8 dihedral symmetries of the board, [symmetry][point] is the point
+# which 'point' is moved to. Point 'dimen * dimen' is PASS and never moves.
+# Symmetry 0 is the identity.
+def _build_symmetry(dimen):
+    last = dimen - 1
+    transforms = [lambda r, c: (r, c),
+                  lambda r, c: (c, last - r),
+                  lambda r, c: (last - r, last - c),
+                  lambda r, c: (last - c, r),
+                  lambda r, c: (r, last - c),
+                  lambda r, c: (c, r),
+                  lambda r, c: (last - r, c),
+                  lambda r, c: (last - c, last - r)]
+    symmetry = []
+    for transform in transforms:
+        index = []
+        for row in range(dimen):
+            for col in range(dimen):
+                new_row, new_col = transform(row, col)
+                index.append(new_row * dimen + new_col)
+        index.append(dimen * dimen)
+        symmetry.append(index)
+    return symmetry
+
+
+# Keys of every [colour][point][symmetry], the key of the point which
+# 'point' is moved to by the symmetry.
+def _build_symmetric_keys(zobrist, symmetry, dimen):
+    return np.array([[[keys[sym[pos]] for sym in symmetry]
+                      for pos in range(dimen * dimen)]
+                     for keys in zobrist], dtype=np.uint64)
+
+
 class Board(object):
     # Gomoku board
     BOARD_DIMEN = 15
@@ -5,23 +90,85 @@ class Board(object):
     BLACK = 1
     WHITE = 2
     PASS = -1
+    # Index of PASS in network policy.
+    PASS_POINT = BOARD_DIMEN * BOARD_DIMEN
     DIR_4 = [[0, 1], [1, 0], [1, 1], [1, -1]]
     WIN = 1
     LOSE = 2
     TIE = 3
     NOTHING = 0
+    # Every row, column and diagonal is a bitboard stored in a small int,
+    # so neighbours on a line are neighbour bits.
+    LINES = 4 * (2 * BOARD_DIMEN - 1)
+    LINE_INDEX = _build_line_index(BOARD_DIMEN)
+    LINE_POINTS = _build_line_points(BOARD_DIMEN, LINE_INDEX)
+    # Bits of the positions which are on the board, for every line.
+    LINE_MASK = [sum(1 << pos for pos, point in enumerate(points)
+                     if point != -1)
+                 for points in LINE_POINTS]
+    # Lines of five or more are counted together.
+    MAX_LINE = 5
+    ZOBRIST = _build_zobrist(BOARD_DIMEN)
+    # Toggled on every move, so the side to move is part of the hash.
+    # Keys of EMPTY are not used for points.
+    ZOBRIST_TURN = ZOBRIST[EMPTY][0]
+    SYMMETRY = _build_symmetry(BOARD_DIMEN)
+    # Same as SYMMETRY, can be used to index policy arrays.
+    SYMMETRY_INDEX = np.array(SYMMETRY, dtype=np.intp)
+    ZOBRIST_SYMMETRIC = _build_symmetric_keys(ZOBRIST, SYMMETRY,
+                                              BOARD_DIMEN)
+    # Masks of '_build_near_masks' by distance, built when first used.
+    NEAR_MASKS = {}
 
-    def __init__(self):
+    # 'near_distance' is the distance of the points returned by
+    # 'candidate_points'.
+    def __init__(self, near_distance=2):
+        self._near_distance = near_distance
+        if near_distance not in self.NEAR_MASKS:
+            self.NEAR_MASKS[near_distance] = _build_near_masks(
+                self.BOARD_DIMEN, near_distance)
         self.clear()
 
     def clear(self):
-        self._board = [[self.EMPTY]*15 for _ in range(15)]
+        self._board = np.zeros((self.BOARD_DIMEN, self.BOARD_DIMEN),
+                               dtype=np.int8)
         self._move = 0
         self._prev_pass = False
+        # Bitboards of every line, per colour.
+        self._lines = [[0] * self.LINES for _ in range(3)]
+        # Number of lines of each length per colour, over all directions.
+        self._line_count = [[0] * (self.MAX_LINE + 1) for _ in range(3)]
+        # Points near any stone, as a bit mask of points.
+        self._near = 0
+        # [row, col, prev_pass, near] of each played move, used by 'undo'.
+        self._history = []
+        self._hash = 0
 
     def who_turn(self):
         return self.BLACK if self._move % 2 == 0 else self.WHITE
 
+    # Zobrist hash of stones and side to move, updated by 'play' and 'undo'.
+    def get_hash(self):
+        return self._hash
+
+    # Return the hash of the board under every symmetry, [0] is the real
+    # board. Built from the stones, only 'get_hash' is kept by 'play'.
+    def get_symmetric_hashes(self):
+        flat = self._board.ravel()
+        points = np.flatnonzero(flat)
+        keys = self.ZOBRIST_SYMMETRIC[flat[points].astype(np.intp), points]
+        hashes = np.bitwise_xor.reduce(keys, axis=0, initial=0)
+        if self._move % 2:
+            hashes ^= np.uint64(self.ZOBRIST_TURN)
+        return hashes
+
+    # Return [hash, symmetry], the hash is the same for all symmetric
+    # positions and 'symmetry' moves this board to the chosen one.
+    def get_canonical_hash(self):
+        hashes = self.get_symmetric_hashes()
+        symmetry = int(np.argmin(hashes))
+        return int(hashes[symmetry]), symmetry
+
     # Return data that going to feed into network.
     # There are 5 feature maps:
     # 1: Black's stone
@@ -29,46 +176,48 @@ class Board(object):
     # 3: Empty position
     # 4: 1 if black's turn else 0
     # 4: 1 if white's turn else 0
-    def get_data_for_network(self):
-        data = []
-        for row in range(self.BOARD_DIMEN):
-            sub_data = []
-            for col in range(self.BOARD_DIMEN):
-                point_data = []
-                if self._board[row][col] == self.BLACK:
-                    point_data += [1, 0, 0]
-                elif self._board[row][col] == self.WHITE:
-                    point_data += [0, 1, 0]
-                else:
-                    point_data += [0, 0, 1]
-
-                if self.who_turn() == self.BLACK:
-                    point_data += [1, 0]
-                else:
-                    point_data += [0, 1]
-
-                sub_data.append(point_data)
-            data.append(sub_data)
-        return data
+    # If 'out' is given, the data is written into it and no new array is
+    # allocated. 'out' should be a float32 array of shape (15, 15, 5),
+    # such as one row of a batch buffer.
+    def get_data_for_network(self, out=None):
+        if out is None:
+            out = np.empty((self.BOARD_DIMEN, self.BOARD_DIMEN, 5),
+                           dtype=np.float32)
+        out[:, :, 0] = self._board == self.BLACK
+        out[:, :, 1] = self._board == self.WHITE
+        out[:, :, 2] = self._board == self.EMPTY
+        black_turn = self.who_turn() == self.BLACK
+        out[:, :, 3] = black_turn
+        out[:, :, 4] = not black_turn
+        return out
 
     # Play at [row, col], and return game status.
     def play(self, row, col):
         if row == -1 and col == -1:
             # Pass.
+            self._history.append((row, col, self._prev_pass, self._near))
+            self._move += 1
+            self._hash ^= self.ZOBRIST_TURN
             if self._prev_pass:
                 return self.TIE
             self._prev_pass = True
-            self._move += 1
             return self.NOTHING
         else:
-            if (self._board[row][col] != self.EMPTY):
+            if not self.is_legal_move(row, col):
                 print('ERROR: play at invalid position.')
                 return self.NOTHING
 
+            self._history.append((row, col, self._prev_pass, self._near))
             self._prev_pass = False
-            self._board[row][col] = self.who_turn()
+            color = self.who_turn()
+            point = row * self.BOARD_DIMEN + col
+            self._board[row, col] = color
             self._move += 1
-            return self._check_win(row, col)
+            self._near |= self.NEAR_MASKS[self._near_distance][point]
+            self._hash ^= self.ZOBRIST[color][point] ^ self.ZOBRIST_TURN
+            if self._add_stone(row, col, color) >= 5:
+                return self.WIN
+            return self.NOTHING
 
     # NOTE: this function doesn't check if [row, col]
     # is correct undo position or not because
@@ -76,36 +225,111 @@ class Board(object):
     # please make sure [row, col] is correct undo position
     # when calling this function.
     def undo(self, row, col):
-        self._board[row][col] = self.EMPTY
+        _, _, self._prev_pass, self._near = self._history.pop()
         self._move -= 1
+        if row != -1:
+            color = self.who_turn()
+            self._board[row, col] = self.EMPTY
+            self._hash ^= (self.ZOBRIST[color][row * self.BOARD_DIMEN + col]
+                           ^ self.ZOBRIST_TURN)
+            self._remove_stone(row, col, color)
+        else:
+            self._hash ^= self.ZOBRIST_TURN
 
     def is_legal_move(self, row, col):
-        return self._board[row][col] == self.EMPTY
+        # Rows are the first lines of bitboards.
+        stones = self._lines[self.BLACK][row] | self._lines[self.WHITE][row]
+        return not (stones >> col) & 1
 
-    # Check the current move five in a row.
-    def _check_win(self, row, col):
-        def _out_of_bound(row, col):
-            return row < 0 or row > 14 or col < 0 or col > 14
+    # Return all empty positions as [row, col], PASS is not included.
+    def legal_moves(self):
+        return np.argwhere(self._board == self.EMPTY).tolist()
 
-        check_color = self._board[row][col]
-        for row_dir, col_dir in self.DIR_4:
-            count = 0
-            for d in range(2):
-                for offset in range(1, 5):
-                    cur_row = row + (row_dir if d == 0 else -row_dir) * offset
-                    cur_col = col + (col_dir if d == 0 else -col_dir) * offset
+    # Same as 'legal_moves', but as an array of row * 15 + col.
+    def legal_points(self):
+        return np.flatnonzero(self._board == self.EMPTY)
 
-                    if _out_of_bound(cur_row, cur_col):
-                        break
+    # Same as 'legal_points', but only the points within 'near_distance'
+    # of any stone. All legal points if there is no stone.
+    def candidate_points(self):
+        if not self._near:
+            return self.legal_points()
+        points = self.BOARD_DIMEN * self.BOARD_DIMEN
+        near = np.unpackbits(
+            np.frombuffer(self._near.to_bytes((points + 7) // 8, 'little'),
+                          dtype=np.uint8),
+            bitorder='little')[:points]
+        return np.flatnonzero(near & (self._board.ravel() == self.EMPTY))
 
-                    if self._board[cur_row][cur_col] != check_color:
-                        break
+    # Return the number of lines of 'length' stones 'color' has,
+    # each direction is counted separately.
+    def line_count(self, color, length):
+        return self._line_count[color][min(length, self.MAX_LINE)]
 
-                    count += 1
+    # Return the number of continuous 'color' stones next to [row, col]
+    # at both sides [below, above], for each direction in DIR_4.
+    # [row, col] itself is not counted.
+    def _side_lengths(self, row, col, color):
+        lines = self._lines[color]
+        lengths = []
+        for line_id, pos in self.LINE_INDEX[row * self.BOARD_DIMEN + col]:
+            line = lines[line_id]
+            # Count trailing ones above and leading ones below 'pos'.
+            above = line >> (pos + 1)
+            above = (~above & (above + 1)).bit_length() - 1
+            below = pos - (~line & ((1 << pos) - 1)).bit_length()
+            lengths.append((below, above))
+        return lengths
 
-            if count >= 4:
-                return self.WIN
+    # Put stone to bitboards and update line counters,
+    # return the longest line which goes through it.
+    def _add_stone(self, row, col, color):
+        lines = self._lines[color]
+        count = self._line_count[color]
+        max_line = self.MAX_LINE
+        longest = 0
+        for line_id, pos in self.LINE_INDEX[row * self.BOARD_DIMEN + col]:
+            line = lines[line_id]
+            above = line >> (pos + 1)
+            above = (~above & (above + 1)).bit_length() - 1
+            below = pos - (~line & ((1 << pos) - 1)).bit_length()
+            lines[line_id] = line | (1 << pos)
+
+            if below:
+                count[below if below < max_line else max_line] -= 1
+            if above:
+                count[above if above < max_line else max_line] -= 1
+            length = below + above + 1
+            count[length if length < max_line else max_line] += 1
+            if length > longest:
+                longest = length
+        return longest
+
+    # Revert '_add_stone'.
+    def _remove_stone(self, row, col, color):
+        lines = self._lines[color]
+        count = self._line_count[color]
+        max_line = self.MAX_LINE
+        for line_id, pos in self.LINE_INDEX[row * self.BOARD_DIMEN + col]:
+            line = lines[line_id] & ~(1 << pos)
+            lines[line_id] = line
+            above = line >> (pos + 1)
+            above = (~above & (above + 1)).bit_length() - 1
+            below = pos - (~line & ((1 << pos) - 1)).bit_length()
 
+            if below:
+                count[below if below < max_line else max_line] += 1
+            if above:
+                count[above if above < max_line else max_line] += 1
+            length = below + above + 1
+            count[length if length < max_line else max_line] -= 1
+
+    # Check the current move five in a row.
+    def _check_win(self, row, col):
+        color = self._board.item(row, col)
+        for below, above in self._side_lengths(row, col, color):
+            if below + above >= 4:
+                return self.WIN
         return self.NOTHING
 
     # Print board, for debug usage.
@@ -144,7 +368,7 @@ class Board(object):
                     else:
                         board += '───'
 
-                    if (self._board[row - 1][col - 1] == self.EMPTY):
+                    if (self._board[row - 1, col - 1] == self.EMPTY):
                         if row == 1:
                             if col == 1:
                                 board += '╔'
@@ -167,7 +391,7 @@ class Board(object):
                             else:
                                 board += '╋' if _start_point(row, col) else '┼'
                     else:
-                        board += 'X' if self._board[row - 1][col - 1] == self.BLACK else 'O'
+                        board += 'X' if self._board[row - 1, col - 1] == self.BLACK else 'O'
 
                     # If at the last column, print \n.
                 if col == self.BOARD_DIMEN + 1:
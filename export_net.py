@@ -0,0 +1,22 @@
+import argparse
+
+import network as nw
+
+
+# Export a checkpoint to an inference only graph for play,
+# e.g. 'python export_net.py --net net/nn --output net/nn.pb'.
+# An '.npz' output is for the NumPy backend.
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--net', default='net/nn', help='checkpoint path')
+    parser.add_argument('--output', default='net/nn.pb')
+    args = parser.parse_args()
+
+    network = nw.Network()
+    network.set_up()
+    network.load(args.net)
+    network.export(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,35 @@
-import tensorflow as tf
+import os
 import random
 
+import tensorflow as tf
+import numpy as np
+
+# Default 'epsilon' of 'tf.layers.batch_normalization'.
+BN_EPSILON = 1e-3
+
 
 class Network(object):
-    def __init__(self, depth=5, width=48):
-        self.sess = tf.Session()
+    # 'threads' limits the TF thread pools, useful when several
+    # networks share the CPU.
+    def __init__(self, depth=5, width=48, threads=None):
+        config = None
+        if threads is not None:
+            config = tf.ConfigProto(intra_op_parallelism_threads=threads,
+                                    inter_op_parallelism_threads=threads)
+        # Every network has its own graph, so several networks can be
+        # used in one process.
+        self.graph = tf.Graph()
+        self.sess = tf.Session(graph=self.graph, config=config)
         # Network's depth and width.
         self.depth = depth
         self.width = width
 
     # Set up network structure.
     def set_up(self):
+        with self.graph.as_default():
+            self._set_up()
+
+    def _set_up(self):
         self.global_step = tf.Variable(0, name="global_step", trainable=False)
         # Input: 15x15x5, output: 225+1.
         self.input = tf.placeholder(tf.float32, [None, 15, 15, 5])
@@ -98,43 +117,78 @@ class Network(object):
 
     # Initialize variable.
     def init_var(self):
-        self.sess.run(tf.global_variables_initializer())
+        with self.graph.as_default():
+            self.sess.run(tf.global_variables_initializer())
 
     def _get_global_step(self):
         return self.sess.run(self.global_step)
 
     # Train network.
-    def train(self, train_data, test_data, batch_size):
+    # 'train_data' and 'test_data' are 'train_data.TrainingData',
+    # both heads are trained on every batch. Samples are moved by random
+    # symmetries if 'augmented', batches are prepared in background
+    # threads while the network trains.
+    def train(self, train_data, test_data, batch_size, augmented=True):
         print('Training ...')
-        for i in range(train_data.data_size // batch_size):
+        batches = train_data.batches(batch_size, augmented)
+        for i, (x, y, z) in enumerate(batches):
             # Upgrade accuracy to summary.
             if i % 50 == 0:
                 step = self._get_global_step()
                 # Accuracy of train data.
-                x, y = train_data.get_random_data(512)
+                sx, sy, sz = train_data.get_random_data(512)
                 summ = self.sess.run(
-                    self.merged, {self.input: x, self.policy: y})
+                    self.merged,
+                    {self.input: sx, self.policy: sy, self.value: sz})
                 self.train_writer.add_summary(summ, step)
                 # Accuracy of test data.
-                x, y = test_data.get_random_data(512)
+                sx, sy, sz = test_data.get_random_data(512)
                 testSumm = self.sess.run(
-                    self.merged, {self.input: x, self.policy: y})
+                    self.merged,
+                    {self.input: sx, self.policy: sy, self.value: sz})
                 self.test_writer.add_summary(testSumm, step)
 
-            # Get in/out data.
-            x, y = train_data.get_data(i * batch_size, batch_size)
             # Train network.
-            self.sess.run([self.opt], {self.input: x, self.policy: y})
+            self.sess.run([self.policy_opt, self.value_opt],
+                          {self.input: x, self.policy: y, self.value: z})
 
     # Save/Load network.
     def save(self, path='net/nn'):
-        tf.train.Saver().save(self.sess, path)
+        with self.graph.as_default():
+            tf.train.Saver().save(self.sess, path)
         print('Saved network to ' + path)
 
     def load(self, path='net/nn'):
-        tf.train.Saver().restore(self.sess, path)
+        with self.graph.as_default():
+            tf.train.Saver().restore(self.sess, path)
         print('Finish loading network from ' + path)
 
+    # Return all variables as {name: array}, e.g. 'conv1/kernel'.
+    def get_weights(self):
+        with self.graph.as_default():
+            variables = tf.global_variables()
+        values = self.sess.run(variables)
+        return {v.op.name: value for v, value in zip(variables, values)}
+
+    # Write an inference only graph to 'path', which is loaded by
+    # 'InferenceNetwork'. Weights are constants with batch norm folded in,
+    # no optimizer, loss or summary is kept.
+    # If 'path' ends with '.npz', only the folded weights are written for
+    # 'numpy_network.NumpyNetwork'.
+    def export(self, path='net/nn.pb'):
+        weights = fold_batch_norm(self.get_weights(), self.depth)
+        if path.endswith('.npz'):
+            np.savez(path, **{name + '/' + kind: w
+                              for name, layer in weights.items()
+                              for kind, w in zip(('kernel', 'bias'), layer)})
+            print('Exported network to ' + path)
+            return
+        graph = _build_inference_graph(weights, self.depth)
+        directory, name = os.path.split(path)
+        tf.train.write_graph(graph.as_graph_def(), directory or '.', name,
+                             as_text=False)
+        print('Exported network to ' + path)
+
     def output_policy(self, input):
         prob = self.sess.run(self.policy_output,
                              feed_dict={self.input: [input]})
@@ -144,11 +198,139 @@ class Network(object):
         return self.sess.run(self.value_output,
                              feed_dict={self.input: [input]})[0][0]
 
+    # Get policy and value of a batch in one run, the residual tower is
+    # only computed once.
+    # 'batch' is an array of shape (B, 15, 15, 5),
+    # return policy of shape (B, 226) and value of shape (B,).
+    def evaluate(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        policy, value = self.sess.run([self.policy_output, self.value_output],
+                                      feed_dict={self.input: batch})
+        return policy, value.reshape([-1])
+
     def display_network(self, input):
-        summ = self.sess.run(self.merged, {self.input: [input],
-                                           self.policy: [[0]*226],
-                                           self.value: [[0]]})
+        batch = np.asarray([input], dtype=np.float32)
+        summ, policy, value = self.sess.run(
+            [self.merged, self.policy_output, self.value_output],
+            {self.input: batch,
+             self.policy: np.zeros([1, 226], dtype=np.float32),
+             self.value: np.zeros([1, 1], dtype=np.float32)})
         self.train_writer.add_summary(summ, 0)
+        return policy[0], value[0][0]
+
+
+# Fold every batch normalization into the layer next to it, the result
+# is {layer: [kernel, bias]}. 'weights' are the variables of 'Network'.
+# Batch norm after a conv is folded into that conv, 'value-bn2' comes
+# after the relu of the value dense layer, so it is folded into the
+# value output layer instead.
+def fold_batch_norm(weights, depth=5):
+    def scale_shift(bn):
+        scale = weights[bn + '/gamma'] / np.sqrt(
+            weights[bn + '/moving_variance'] + BN_EPSILON)
+        shift = weights[bn + '/beta'] - weights[bn + '/moving_mean'] * scale
+        return scale, shift
+
+    def fold_conv(conv, bn):
+        scale, shift = scale_shift(bn)
+        return [weights[conv + '/kernel'] * scale,
+                weights[conv + '/bias'] * scale + shift]
+
+    layers = {'conv1': fold_conv('conv1', 'bn1')}
+    for i in range(1, depth + 1):
+        for j in ('-1', '-2'):
+            name = 'conv' + str(i) + j
+            layers[name] = fold_conv(name, 'bn' + str(i) + j)
+    layers['policy-conv'] = fold_conv('policy-conv', 'policy-bn')
+    layers['value-conv'] = fold_conv('value-conv', 'value-bn')
+    # Dense layers are unnamed in 'Network.set_up'.
+    layers['policy-dense'] = [weights['dense/kernel'], weights['dense/bias']]
+    layers['value-dense'] = [weights['dense_1/kernel'],
+                             weights['dense_1/bias']]
+    scale, shift = scale_shift('value-bn2')
+    kernel = weights['dense_2/kernel']
+    layers['value-output'] = [kernel * scale[:, np.newaxis],
+                              weights['dense_2/bias'] + shift.dot(kernel)]
+    return {name: [np.asarray(w, dtype=np.float32) for w in layer]
+            for name, layer in layers.items()}
+
+
+# Build the inference graph of 'Network' from folded weights, the input is
+# 'input:0', outputs are 'policy_output:0' and 'value_output:0'.
+def _build_inference_graph(layers, depth=5):
+    def conv(x, name):
+        kernel, bias = layers[name]
+        x = tf.nn.conv2d(x, tf.constant(kernel), [1, 1, 1, 1], 'SAME')
+        return tf.nn.bias_add(x, tf.constant(bias))
+
+    def dense(x, name):
+        kernel, bias = layers[name]
+        return tf.matmul(x, tf.constant(kernel)) + tf.constant(bias)
+
+    graph = tf.Graph()
+    with graph.as_default():
+        input = tf.placeholder(tf.float32, [None, 15, 15, 5], name='input')
+        net = tf.nn.relu(conv(input, 'conv1'))
+        for i in range(1, depth + 1):
+            res = tf.nn.relu(conv(net, 'conv' + str(i) + '-1'))
+            net = tf.nn.relu(conv(res, 'conv' + str(i) + '-2') + net)
+
+        policy = tf.reshape(conv(net, 'policy-conv'), [-1, 15*15*2])
+        policy = tf.nn.relu(dense(policy, 'policy-dense'))
+        tf.nn.softmax(policy, name='policy_output')
+
+        value = tf.reshape(conv(net, 'value-conv'), [-1, 15*15])
+        value = tf.nn.relu(dense(value, 'value-dense'))
+        tf.tanh(dense(value, 'value-output'), name='value_output')
+    return graph
+
+
+class InferenceNetwork(object):
+    # Network for play, loaded from a graph written by 'Network.export'.
+    # Only has 'evaluate', nothing for training is built.
+    def __init__(self, path='net/nn.pb', threads=None):
+        config = None
+        if threads is not None:
+            config = tf.ConfigProto(intra_op_parallelism_threads=threads,
+                                    inter_op_parallelism_threads=threads)
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(path, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.sess = tf.Session(graph=self.graph, config=config)
+        self.input = self.graph.get_tensor_by_name('input:0')
+        self.policy_output = self.graph.get_tensor_by_name('policy_output:0')
+        self.value_output = self.graph.get_tensor_by_name('value_output:0')
+        print('Finish loading network from ' + path)
+
+    # Same as 'Network.evaluate'.
+    def evaluate(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        policy, value = self.sess.run([self.policy_output, self.value_output],
+                                      feed_dict={self.input: batch})
+        return policy, value.reshape([-1])
+
+
+# Return a network for play. A path ending with '.pb' is a graph written
+# by 'Network.export', otherwise it is a checkpoint which is loaded into
+# the full training graph. Random weights if 'path' is None, initialized
+# with the graph seed 'seed' so every process gets the same network.
+def load_network(path, threads=None, seed=0):
+    if path is not None and path.endswith('.pb'):
+        return InferenceNetwork(path, threads)
+    network = Network(threads=threads)
+    if path is None:
+        with network.graph.as_default():
+            tf.set_random_seed(seed)
+    network.set_up()
+    if path is not None:
+        network.load(path)
+    else:
+        # Random weights, useful for testing and benchmarking.
+        network.init_var()
+    return network
 
 
 def main():
@@ -159,8 +341,9 @@ def main():
              for _ in range(15)]
              for _ in range(15)]
     print(input)
-    print(net.output_policy(input))
-    print(net.output_value(input))
+    policy, value = net.evaluate([input])
+    print(policy[0])
+    print(value[0])
     net.display_network(input)
     net.save()
 
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+# Network for play computed with NumPy only, so TensorFlow is not
+# imported. Weights are read from a '.npz' file written by
+# 'Network.export', with batch norm already folded into the layers.
+# Convolutions are done as im2col and one matrix multiply, the BLAS
+# threads are set by the environment, e.g. OMP_NUM_THREADS.
+class NumpyNetwork(object):
+    def __init__(self, path='net/nn.npz'):
+        with np.load(path) as weights:
+            self._layers = {}
+            for key in weights.files:
+                name, kind = key.split('/')
+                layer = self._layers.setdefault(name, [None, None])
+                layer[0 if kind == 'kernel' else 1] = weights[key].astype(
+                    np.float32)
+        self.depth = sum(1 for name in self._layers
+                         if name.startswith('conv') and name.endswith('-1'))
+        # Kernels as matrices, (kernel_h * kernel_w * in, out).
+        for layer in self._layers.values():
+            kernel = layer[0]
+            if kernel.ndim == 4:
+                layer[0] = kernel.reshape(-1, kernel.shape[3])
+        # Padded input and im2col buffers by input channels, for the
+        # largest batch so far. Smaller batches use the front part.
+        self._buffers = {}
+        print('Finish loading network from ' + path)
+
+    def _get_buffers(self, size, channels):
+        buffers = self._buffers.get(channels)
+        if buffers is None or len(buffers[0]) < size:
+            buffers = (np.zeros((size, 17, 17, channels), dtype=np.float32),
+                       np.empty((size, 15, 15, 9, channels),
+                                dtype=np.float32))
+            self._buffers[channels] = buffers
+        return buffers[0][:size], buffers[1][:size]
+
+    # 3x3 'same' convolution plus bias, x is (B, 15, 15, C).
+    def _conv3(self, x, name):
+        kernel, bias = self._layers[name]
+        size, _, _, channels = x.shape
+        padded, columns = self._get_buffers(size, channels)
+        padded[:, 1:16, 1:16] = x
+        for dy in range(3):
+            for dx in range(3):
+                columns[:, :, :, dy * 3 + dx] = padded[:, dy:dy + 15,
+                                                       dx:dx + 15]
+        out = columns.reshape(size * 225, 9 * channels).dot(kernel)
+        out += bias
+        return out.reshape(size, 15, 15, -1)
+
+    # 1x1 convolution plus bias, flattened as 'tf.reshape' does.
+    def _conv1(self, x, name):
+        kernel, bias = self._layers[name]
+        out = x.reshape(-1, x.shape[3]).dot(kernel)
+        out += bias
+        return out.reshape(x.shape[0], -1)
+
+    def _dense(self, x, name):
+        kernel, bias = self._layers[name]
+        out = x.dot(kernel)
+        out += bias
+        return out
+
+    # Same as 'Network.evaluate'.
+    def evaluate(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        net = np.maximum(self._conv3(batch, 'conv1'), 0)
+        for i in range(1, self.depth + 1):
+            res = np.maximum(self._conv3(net, 'conv' + str(i) + '-1'), 0)
+            res = self._conv3(res, 'conv' + str(i) + '-2')
+            res += net
+            net = np.maximum(res, 0, out=res)
+
+        policy = self._conv1(net, 'policy-conv')
+        policy = np.maximum(self._dense(policy, 'policy-dense'), 0)
+        policy -= policy.max(axis=1, keepdims=True)
+        policy = np.exp(policy, out=policy)
+        policy /= policy.sum(axis=1, keepdims=True)
+
+        value = self._conv1(net, 'value-conv')
+        value = np.maximum(self._dense(value, 'value-dense'), 0)
+        value = np.tanh(self._dense(value, 'value-output'))
+        return policy, value.reshape([-1])
@@ -0,0 +1,147 @@
+import multiprocessing as mp
+import signal
+
+import numpy as np
+
+import board as bd
+
+
+# Root parallel search: every worker process has its own UctTree of the
+# same position, with Dirichlet noise at the root so the trees differ.
+# The visit counts of the root moves are added up to pick the move.
+# For one shared tree searched by threads see
+# 'UctTree.mcts_visit_threaded'.
+
+
+# Worker process, runs the commands from 'conn' on its own tree and sends
+# back the results, or the exception if a command fails.
+def _worker(conn, net_path, seed, noise, tree_args):
+    # Only the main process handles Ctrl-C.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import uct_tree
+
+    np.random.seed(seed)
+    tree = uct_tree.UctTree(net_path, **tree_args)
+    noisy = False
+    while True:
+        command, args = conn.recv()
+        if command == 'close':
+            break
+        try:
+            if command == 'search':
+                if noise and not noisy:
+                    tree.add_root_noise(*noise)
+                    noisy = True
+                stats = tree.mcts_visit(*args)
+                result = tree.get_visits(), stats
+            elif command == 'play':
+                result = tree.play(*args)
+                noisy = False
+            elif command == 'restart':
+                tree.restart()
+                noisy = False
+                result = None
+            elif command == 'clear_tt':
+                tree.clear_tt()
+                result = None
+            else:
+                raise ValueError('unknown command: ' + command)
+        except Exception as e:
+            result = e
+        conn.send(result)
+    conn.close()
+
+
+class RootParallelTree(object):
+    # 'workers' processes with a UctTree each, made with 'tree_args'. All
+    # of them load 'net_path', or the same seeded random weights if it is
+    # None.
+    # 'noise' is [alpha, fraction] of 'UctTree.add_root_noise', None for
+    # no noise. Worker i uses the seed 'seed + i'.
+    def __init__(self, net_path='nn/net', workers=mp.cpu_count(),
+                 noise=(0.3, 0.25), seed=0, **tree_args):
+        ctx = mp.get_context('spawn')
+        self._conns = []
+        self._workers = []
+        for i in range(workers):
+            conn, child_conn = ctx.Pipe()
+            worker = ctx.Process(target=_worker,
+                                 args=(child_conn, net_path, seed + i,
+                                       noise, tree_args),
+                                 daemon=True)
+            worker.start()
+            self._conns.append(conn)
+            self._workers.append(worker)
+        self._board = bd.Board()
+        self._visits = None
+
+    # Send a command to every worker and return their results.
+    def _call(self, command, *args):
+        for conn in self._conns:
+            conn.send((command, args))
+        results = [conn.recv() for conn in self._conns]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def restart(self):
+        self._call('restart')
+        self._board.clear()
+        self._visits = None
+
+    def clear_tt(self):
+        self._call('clear_tt')
+
+    # Search every tree as 'UctTree.mcts_visit' does, the budgets are per
+    # worker. Return the statistics of the search, 'playouts' and
+    # 'root_visits' are added up over the workers.
+    def mcts_visit(self, visit=None, batch_size=1, seconds=None,
+                   max_nodes=None, early_stop=False):
+        results = self._call('search', visit, batch_size, seconds,
+                             max_nodes, early_stop)
+        self._visits = sum(visits for visits, _ in results)
+        stats = [each for _, each in results]
+        playouts = sum(each['playouts'] for each in stats)
+        seconds = max(each['seconds'] for each in stats)
+        return {'playouts': playouts,
+                'root_visits': sum(each['root_visits'] for each in stats),
+                'seconds': seconds,
+                'playouts_per_second': playouts / seconds if seconds > 0
+                else 0.0,
+                'nodes': sum(each['nodes'] for each in stats),
+                'stop_reason': stats[0]['stop_reason']}
+
+    # Return the added visit count of every move of the last search
+    # indexed by point, 225 is PASS.
+    def get_visits(self):
+        return self._visits
+
+    # Return [row, col] of the move with the most added visits.
+    def get_best_move(self, verbose=True):
+        point = int(np.argmax(self._visits))
+        if verbose:
+            print('point: {}, visit: {}'.format(point, self._visits[point]))
+        if point == bd.Board.PASS_POINT:
+            return -1, -1
+        return divmod(point, bd.Board.BOARD_DIMEN)
+
+    def who_turn(self):
+        return self._board.who_turn()
+
+    def get_board(self):
+        return self._board
+
+    # Play at [row, col] in every tree, return game status.
+    def play(self, row, col):
+        self._call('play', row, col)
+        self._visits = None
+        return self._board.play(row, col)
+
+    def close(self):
+        for conn in self._conns:
+            conn.send(('close', ()))
+        for worker in self._workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
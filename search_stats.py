@@ -0,0 +1,77 @@
+import contextlib
+import time
+
+
+# Counters and timers of 'UctTree.mcts_visit', enabled by
+# 'UctTree(instrument=True)'. Times are in seconds.
+# 'select' includes the 'play_undo' of the descent, the other phases
+# don't overlap.
+class SearchStats(object):
+    PHASES = ('select', 'play_undo', 'tactics', 'transposition', 'encode',
+              'eval', 'expand', 'backprop')
+    COUNTERS = ('playouts', 'collisions', 'terminal', 'proven', 'tt_hits',
+                'evaluated', 'batches')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.times = {phase: 0.0 for phase in self.PHASES}
+        self.calls = {phase: 0 for phase in self.PHASES}
+        self.counters = {name: 0 for name in self.COUNTERS}
+
+    def add(self, phase, seconds):
+        self.times[phase] += seconds
+        self.calls[phase] += 1
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    # Use as 'with stats.timer(phase):'.
+    def timer(self, phase):
+        return _PhaseTimer(self, phase)
+
+    def to_dict(self):
+        return {'times': dict(self.times),
+                'calls': dict(self.calls),
+                'counters': dict(self.counters)}
+
+
+class _PhaseTimer(object):
+    __slots__ = ('_stats', '_phase', '_start')
+
+    def __init__(self, stats, phase):
+        self._stats = stats
+        self._phase = phase
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self._stats.add(self._phase, time.perf_counter() - self._start)
+
+
+# Used instead of a timer when the stats are disabled.
+NO_TIMER = contextlib.nullcontext()
+
+
+class TimedBoard(object):
+    # Board which adds the time of 'play' and 'undo' to 'stats',
+    # everything else is the wrapped board.
+    def __init__(self, board, stats):
+        self._wrapped = board
+        self._stats = stats
+
+    def play(self, row, col):
+        start = time.perf_counter()
+        status = self._wrapped.play(row, col)
+        self._stats.add('play_undo', time.perf_counter() - start)
+        return status
+
+    def undo(self, row, col):
+        start = time.perf_counter()
+        self._wrapped.undo(row, col)
+        self._stats.add('play_undo', time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
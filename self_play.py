@@ -1,18 +1,295 @@
-import uct_tree
+import argparse
+import cProfile
+import json
+import os
+import queue
+import time
+
 import board as bd
+import time_control
+import train_data
+import worker_pool
+
+# Default of '--random-moves' with several workers or training data,
+# the search is deterministic and would play the same game every time.
+DEFAULT_RANDOM_MOVES = 8
+
+
+# Play one game from the empty board.
+# Every move is searched for 'playouts' playouts and at most 'seconds',
+# None is no limit. If 'clock' is given, each player has 'clock' seconds
+# for the whole game, which are split over the moves by 'GameClock'.
+# If 'early_stop', a search stops once its best move is decided.
+# The first 'random_moves' moves are sampled by visit count so games
+# differ from each other, the rest are the best moves.
+# If 'writer' is given, every position is written to it as training data
+# when the game ends.
+# If 'stats_file' is given, a JSON line of the search, tree and cache
+# stats of every move is written to it, see 'UctTree.get_stats'.
+# Return [winner, moves], winner is the colour which made five in a row
+# or Board.EMPTY for a tie. Return None if 'stop_event' is set.
+def play_game(tree, playouts, batch_size=1, random_moves=0,
+              stop_event=None, display=False, writer=None, seconds=None,
+              clock=None, early_stop=False, stats_file=None):
+    tree.restart()
+    game_id = '{}-{}'.format(os.getpid(), int(time.time() * 1000))
+    game = train_data.GameRecord() if writer is not None else None
+    clocks = None
+    if clock is not None:
+        clocks = {color: time_control.GameClock(clock)
+                  for color in (bd.Board.BLACK, bd.Board.WHITE)}
+    moves = 0
+    while True:
+        if stop_event is not None and stop_event.is_set():
+            return None
+
+        tree.reset_tt_stats()
+        tree.reset_search_stats()
+        color = tree.who_turn()
+        budget = seconds
+        if clocks is not None:
+            allocated = clocks[color].allocate()
+            budget = allocated if budget is None else min(budget, allocated)
+        stats = tree.mcts_visit(playouts, batch_size, budget,
+                                early_stop=early_stop)
+        if clocks is not None:
+            clocks[color].consume(stats['seconds'])
+        if game is not None:
+            game.add(tree.get_board(), tree.get_visits())
+        if stats_file is not None:
+            _write_stats(stats_file, game_id, moves, stats, tree)
+        if moves < random_moves:
+            row, col = tree.sample_move()
+        else:
+            row, col = tree.get_best_move(verbose=display)
+
+        status = tree.play(row, col)
+        moves += 1
+        if display:
+            print('Finish mcts, search: {}, transposition table: {}'
+                  .format(stats, tree.get_tt_stats()))
+            tree.print_board()
+            print("%c[%d;%df" % (0x1B, 0, 0), end='')
+
+        if status != bd.Board.NOTHING:
+            winner = color if status == bd.Board.WIN else bd.Board.EMPTY
+            if writer is not None:
+                writer.write(game.finish(winner))
+            return winner, moves
+
+
+# Append one JSON line, in a single write so the lines of several
+# workers sharing the file are not mixed.
+def _write_stats(stats_file, game_id, move, search, tree):
+    record = {'game': game_id, 'move': move, 'result': search}
+    record.update(tree.get_stats())
+    stats_file.write(json.dumps(record, default=float) + '\n')
+    stats_file.flush()
+
+
+def _make_tree(args):
+    import uct_tree
+    return uct_tree.UctTree(args.net, network_threads=args.threads,
+                            use_tactics=not args.no_tactics,
+                            vct_depth=args.vct_depth,
+                            near_distance=args.near_distance,
+                            top_k=args.top_k, top_p=args.top_p,
+                            instrument=args.stats_file is not None)
+
+
+def _open_stats_file(args):
+    if args.stats_file is None:
+        return None
+    return open(args.stats_file, 'a')
+
+
+# Call 'func(*func_args)' under cProfile if 'path' is given, the profile
+# is written to 'path' also if interrupted.
+def _run_profiled(path, func, *func_args):
+    if path is None:
+        return func(*func_args)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return func(*func_args)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def _make_writer(args):
+    if args.data_dir is None:
+        return None
+    return train_data.RecordWriter(
+        args.data_dir, 'selfplay-{}'.format(os.getpid()), args.shard_size)
+
+
+# Worker process, plays a game for every token from 'task_queue' with its
+# own tree and network, and sends the result back to 'result_queue'.
+def _worker(worker_id, task_queue, result_queue, stop_event, args):
+    profile = None
+    if args.profile is not None:
+        profile = '{}.{}'.format(args.profile, worker_id)
+    _run_profiled(profile, _work, worker_id, args, task_queue,
+                  result_queue, stop_event)
+
+
+def _work(worker_id, args, task_queue, result_queue, stop_event):
+    import numpy as np
+
+    np.random.seed((worker_id * 7919 + int(time.time())) % (2 ** 32))
+    tree = _make_tree(args)
+    writer = _make_writer(args)
+    stats_file = _open_stats_file(args)
+    while not stop_event.is_set():
+        try:
+            task = task_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if task is None:
+            break
+
+        result = play_game(tree, args.playouts, args.batch_size,
+                           args.random_moves, stop_event, writer=writer,
+                           seconds=args.seconds, clock=args.clock,
+                           early_stop=args.early_stop,
+                           stats_file=stats_file)
+        if result is not None:
+            result_queue.put((worker_id,) + result)
+    if writer is not None:
+        writer.close()
+    if stats_file is not None:
+        stats_file.close()
+
+
+def _print_result(games, start, worker_id, winner, moves):
+    elapsed = time.time() - start
+    print('game {}: worker {}, winner: {}, moves: {}, '
+          'games/hour: {:.1f}'.format(
+              games, worker_id,
+              {bd.Board.BLACK: 'black', bd.Board.WHITE: 'white'}.get(
+                  winner, 'tie'),
+              moves, games * 3600.0 / elapsed))
+
+
+# Run self-play games in 'args.workers' processes.
+# Every worker has its own UctTree, so the cores are used independently.
+def parallel_self_play(args):
+    pool = worker_pool.WorkerPool(_worker, args.workers, args)
+    # One token per game, 0 games means play until interrupted.
+    tokens = args.games if args.games > 0 else 2 * args.workers
+    for _ in range(tokens):
+        pool.task_queue.put(True)
+    pool.start()
+    if args.games > 0:
+        pool.finish()
+
+    start = time.time()
+    games = 0
+    try:
+        for result in pool.results():
+            games += 1
+            _print_result(games, start, *result)
+            if args.games <= 0:
+                pool.task_queue.put(True)
+    except KeyboardInterrupt:
+        print('Stopping workers ...')
+    finally:
+        pool.close()
+
+    elapsed = time.time() - start
+    print('Finish {} games in {:.1f}s, games/hour: {:.1f}'.format(
+        games, elapsed, games * 3600.0 / elapsed if elapsed > 0 else 0.0))
 
 
 def main():
-    tree = uct_tree.UctTree('net/nn')
-    mc = 1000
-    while 1:
-        tree.mcts_visit(mc)
-        print('Finish mcts')
-        row, col = tree.get_best_move()
-        if tree.play(row, col) != bd.Board.NOTHING:
-            tree.restart()
-        tree.print_board()
-        print("%c[%d;%df" % (0x1B, 0, 0), end='')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--net', default='net/nn',
+                        help="checkpoint, exported '.pb' or '.npz' network, "
+                             "'none' for random weights")
+    parser.add_argument('--games', type=int, default=0,
+                        help='number of games, 0 to play until interrupted')
+    parser.add_argument('--playouts', type=int, default=1000,
+                        help='playouts per move, 0 for no limit')
+    parser.add_argument('--seconds', type=float, default=None,
+                        help='search time per move')
+    parser.add_argument('--clock', type=float, default=None,
+                        help='search time per player for a whole game')
+    parser.add_argument('--early-stop', action='store_true',
+                        help='stop a search once its best move is decided')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes, 1 plays in this process '
+                             'and displays the board')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='TF threads per worker, default 1 with '
+                             '--workers > 1, otherwise all cores')
+    parser.add_argument('--random-moves', type=int, default=None,
+                        help='number of opening moves sampled by visits, '
+                             'default {} with --workers > 1 or --data-dir, '
+                             'otherwise 0'.format(DEFAULT_RANDOM_MOVES))
+    parser.add_argument('--no-tactics', action='store_true',
+                        help='search without the tactical solver')
+    parser.add_argument('--vct-depth', type=int, default=0,
+                        help='threat moves searched for a VCT by the '
+                             'tactical solver, 0 searches only VCF')
+    parser.add_argument('--near-distance', type=int, default=None,
+                        help='only search moves this close to a stone')
+    parser.add_argument('--top-k', type=int, default=None,
+                        help='only search the moves of the k best priors')
+    parser.add_argument('--top-p', type=float, default=None,
+                        help='only search the best moves up to this part '
+                             'of the prior')
+    parser.add_argument('--data-dir', default=None,
+                        help='write training data shards to this directory')
+    parser.add_argument('--shard-size', type=int, default=100000,
+                        help='positions per training data shard')
+    parser.add_argument('--stats-file', default=None,
+                        help='append a JSON line of search stats per move '
+                             'to this file')
+    parser.add_argument('--profile', default=None,
+                        help='write a cProfile profile to this file, '
+                             "workers write to '<file>.<worker id>'")
+    args = parser.parse_args()
+    if args.net == 'none':
+        args.net = None
+    if args.playouts <= 0:
+        if args.seconds is None and args.clock is None:
+            parser.error('--playouts 0 needs --seconds or --clock')
+        args.playouts = None
+    if args.threads is None and args.workers > 1:
+        # One core per worker, every session would use all of them.
+        args.threads = 1
+    if args.random_moves is None:
+        args.random_moves = 0
+        if args.workers > 1 or args.data_dir is not None:
+            args.random_moves = DEFAULT_RANDOM_MOVES
+
+    if args.workers > 1:
+        parallel_self_play(args)
+        return
+
+    _run_profiled(args.profile, self_play, args)
+
+
+# Play games in this process and display the board.
+def self_play(args):
+    tree = _make_tree(args)
+    writer = _make_writer(args)
+    stats_file = _open_stats_file(args)
+    games = 0
+    try:
+        while args.games <= 0 or games < args.games:
+            play_game(tree, args.playouts, args.batch_size,
+                      args.random_moves, display=True, writer=writer,
+                      seconds=args.seconds, clock=args.clock,
+                      early_stop=args.early_stop, stats_file=stats_file)
+            games += 1
+    finally:
+        if writer is not None:
+            writer.close()
+        if stats_file is not None:
+            stats_file.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,351 @@
+import board as bd
+
+
+# Threat detection and threat-space search on 'Board'.
+#
+# Threats are found line by line on the bitboards of 'Board', the result
+# of a line only depends on its own and empty bits, so it is cached.
+# Points are row * 15 + col. Five or more in a row wins, as in 'Board'.
+#
+# The searches only play forcing moves of the attacker:
+#   VCF: victory by continuous fours, the defender has one reply.
+#   VCT: victory by continuous threats, fours and open threes. The
+#        defender may block the three at any point which stops it, or
+#        counter with a four.
+# A search is bounded by depth in attacker moves and a number of nodes,
+# a win is only returned if it is proven, running out of bounds is no win.
+
+# Clear the line cache when it grows over this many entries.
+MAX_CACHE = 1 << 18
+_line_cache = {}
+
+
+def _other(color):
+    return bd.Board.BLACK + bd.Board.WHITE - color
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low
+        mask ^= low
+
+
+def _popcount(mask):
+    return bin(mask).count('1')
+
+
+# Empty positions near 'own' stones, which could make a new threat.
+def _near(own):
+    return (own << 1 | own << 2 | own << 3 | own << 4 |
+            own >> 1 | own >> 2 | own >> 3 | own >> 4)
+
+
+# Empty positions which make five or more, i.e. a window of 5 positions
+# with 4 'own' stones and this empty position.
+def _five_points(own, empty):
+    o1 = own >> 1
+    o2 = own >> 2
+    o3 = own >> 3
+    o4 = own >> 4
+    return ((empty & o1 & o2 & o3 & o4) |
+            ((own & (empty >> 1) & o2 & o3 & o4) << 1) |
+            ((own & o1 & (empty >> 2) & o3 & o4) << 2) |
+            ((own & o1 & o2 & (empty >> 3) & o4) << 3) |
+            ((own & o1 & o2 & o3 & (empty >> 4)) << 4))
+
+
+# Empty positions which make a four with two new five points,
+# which can not be blocked.
+def _open_four_points(own, empty):
+    fives = _five_points(own, empty)
+    result = 0
+    for point in _bits(_near(own) & empty & ~fives):
+        new = _five_points(own | point, empty & ~point) & ~fives
+        if _popcount(new) >= 2:
+            result |= point
+    return result
+
+
+# Return threat positions of one line as bits [fives, fours, open_fours,
+# threes]. A four has at least one new five point, an open four at least
+# two. An open three can be made into an open four by one more move.
+def _analyse_line(own, empty):
+    fives = _five_points(own, empty)
+    fours = 0
+    open_fours = 0
+    threes = 0
+    open_before = None
+    for point in _bits(_near(own) & empty & ~fives):
+        own_after = own | point
+        empty_after = empty & ~point
+        count = _popcount(_five_points(own_after, empty_after) & ~fives)
+        if count:
+            fours |= point
+            if count >= 2:
+                open_fours |= point
+            continue
+        if open_before is None:
+            open_before = _open_four_points(own, empty)
+        if _open_four_points(own_after, empty_after) & ~open_before:
+            threes |= point
+    return fives, fours, open_fours, threes
+
+
+def _line_threats(own, empty):
+    key = own << bd.Board.BOARD_DIMEN | empty
+    result = _line_cache.get(key)
+    if result is None:
+        if len(_line_cache) >= MAX_CACHE:
+            _line_cache.clear()
+        result = _line_cache[key] = _analyse_line(own, empty)
+    return result
+
+
+class Threats(object):
+    # Threat points of one colour, see '_analyse_line'. 'fours' and
+    # 'threes' map a point to the number of lines it makes them in.
+    def __init__(self):
+        self.fives = set()
+        self.fours = {}
+        self.open_fours = set()
+        self.threes = {}
+
+    # Points which make two threats at once: four-four, four-three or
+    # three-three, in different lines.
+    def double_threats(self):
+        points = set()
+        for point, count in self.fours.items():
+            if count >= 2 or point in self.threes:
+                points.add(point)
+        for point, count in self.threes.items():
+            if count >= 2:
+                points.add(point)
+        return points
+
+
+# Return 'Threats' of 'color' on 'board'.
+def find_threats(board, color):
+    threats = Threats()
+    own_lines = board._lines[color]
+    other_lines = board._lines[_other(color)]
+    line_points = bd.Board.LINE_POINTS
+    line_mask = bd.Board.LINE_MASK
+    for line_id in range(bd.Board.LINES):
+        own = own_lines[line_id]
+        # Threats need at least two stones.
+        if own & (own - 1) == 0:
+            continue
+        empty = line_mask[line_id] & ~(own | other_lines[line_id])
+        fives, fours, open_fours, threes = _line_threats(own, empty)
+        if not (fives or fours or threes):
+            continue
+        points = line_points[line_id]
+        for bit in _bits(fives):
+            threats.fives.add(points[bit.bit_length() - 1])
+        for bit in _bits(fours):
+            point = points[bit.bit_length() - 1]
+            threats.fours[point] = threats.fours.get(point, 0) + 1
+        for bit in _bits(open_fours):
+            threats.open_fours.add(points[bit.bit_length() - 1])
+        for bit in _bits(threes):
+            point = points[bit.bit_length() - 1]
+            threats.threes[point] = threats.threes.get(point, 0) + 1
+    return threats
+
+
+# Return the points where 'color' makes five or more.
+def five_points(board, color):
+    result = set()
+    own_lines = board._lines[color]
+    other_lines = board._lines[_other(color)]
+    line_points = bd.Board.LINE_POINTS
+    line_mask = bd.Board.LINE_MASK
+    for line_id in range(bd.Board.LINES):
+        own = own_lines[line_id]
+        # Fives need at least four stones.
+        if own & (own - 1) == 0:
+            continue
+        empty = line_mask[line_id] & ~(own | other_lines[line_id])
+        fives = _line_threats(own, empty)[0]
+        for bit in _bits(fives):
+            result.add(line_points[line_id][bit.bit_length() - 1])
+    return result
+
+
+# Return the points where the side to move or the opponent makes five,
+# a four or an open three. A pruned list of moves should keep them.
+def threat_points(board):
+    color = board.who_turn()
+    points = set()
+    for side in (color, _other(color)):
+        threats = find_threats(board, side)
+        points.update(threats.fives, threats.fours, threats.threes)
+    return points
+
+
+def _play(board, point):
+    return board.play(*divmod(point, bd.Board.BOARD_DIMEN))
+
+
+def _undo(board, point):
+    board.undo(*divmod(point, bd.Board.BOARD_DIMEN))
+
+
+# Return {line_id: open four bits} of 'color'.
+def _open_four_lines(board, color):
+    result = {}
+    own_lines = board._lines[color]
+    other_lines = board._lines[_other(color)]
+    line_mask = bd.Board.LINE_MASK
+    for line_id in range(bd.Board.LINES):
+        own = own_lines[line_id]
+        if own & (own - 1) == 0:
+            continue
+        empty = line_mask[line_id] & ~(own | other_lines[line_id])
+        open_fours = _line_threats(own, empty)[2]
+        if open_fours:
+            result[line_id] = open_fours
+    return result
+
+
+# Return the replies of the side to move which stop every open four point
+# of 'color', and its own fours. Any other move loses to an open four.
+# A move only changes the lines through it, so a block must be on every
+# line with open four points, and leave none of them on these lines.
+def _defences(board, color):
+    defender = _other(color)
+    replies = set(find_threats(board, defender).fours)
+    open_lines = _open_four_lines(board, color)
+    if not open_lines:
+        return replies
+    own_lines = board._lines[color]
+    other_lines = board._lines[defender]
+    line_mask = bd.Board.LINE_MASK
+    first = next(iter(open_lines))
+    empty = line_mask[first] & ~(own_lines[first] | other_lines[first])
+    for bit in _bits(empty):
+        point = bd.Board.LINE_POINTS[first][bit.bit_length() - 1]
+        if point in replies:
+            continue
+        blocked = 0
+        for line_id, pos in bd.Board.LINE_INDEX[point]:
+            if line_id not in open_lines:
+                continue
+            own = own_lines[line_id]
+            empty_after = line_mask[line_id] & ~(
+                own | other_lines[line_id] | 1 << pos)
+            if _line_threats(own, empty_after)[2]:
+                break
+            blocked += 1
+        else:
+            if blocked == len(open_lines):
+                replies.add(point)
+    return replies
+
+
+# Return the first move of a forced win of the side to move within 'depth'
+# attacker moves, or None. Only fours are played if not 'threes'.
+# 'budget' is a list of one int, the nodes which can still be searched.
+def _search(board, depth, threes, budget):
+    budget[0] -= 1
+    if budget[0] < 0:
+        return None
+    color = board.who_turn()
+    defender = _other(color)
+    threats = find_threats(board, color)
+    if threats.fives:
+        return min(threats.fives)
+    if depth <= 0:
+        return None
+
+    blocks = five_points(board, defender)
+    if len(blocks) >= 2:
+        return None
+    # Open fours first, then fours, then threes.
+    moves = sorted(threats.open_fours)
+    moves += sorted(set(threats.fours) - threats.open_fours)
+    if threes:
+        moves += sorted(threats.double_threats() - set(threats.fours))
+        moves += sorted(set(threats.threes) - threats.double_threats())
+    if blocks:
+        # Must block the defender's four first.
+        moves = [move for move in moves if move in blocks]
+
+    for move in moves:
+        _play(board, move)
+        fives = five_points(board, color)
+        if len(fives) >= 2:
+            replies = None
+        elif fives:
+            replies = fives
+        elif find_threats(board, color).open_fours:
+            replies = _defences(board, color)
+        else:
+            # Not a threat after all.
+            _undo(board, move)
+            continue
+        win = replies is None or _refute_all(board, replies, depth, threes,
+                                             budget)
+        _undo(board, move)
+        if win:
+            return move
+    return None
+
+
+# Return True if the attacker still wins after every reply in 'replies'.
+def _refute_all(board, replies, depth, threes, budget):
+    for reply in sorted(replies):
+        if _play(board, reply) == bd.Board.WIN:
+            _undo(board, reply)
+            return False
+        win = _search(board, depth - 1, threes, budget) is not None
+        _undo(board, reply)
+        if not win:
+            return False
+    return True
+
+
+# Return the first move of a VCF of the side to move, or None.
+def find_vcf(board, depth=10, max_nodes=200):
+    return _search(board, depth, False, [max_nodes])
+
+
+# Return the first move of a VCT of the side to move, or None.
+def find_vct(board, depth=3, max_nodes=200):
+    return _search(board, depth, True, [max_nodes])
+
+
+# Tactical status of the side to move, return [status, points].
+# 'status' is Board.WIN if the side to move has a forced win, with the
+# winning moves as 'points'. It is Board.LOSE if the opponent has a win
+# which can not be stopped. Otherwise it is Board.NOTHING, and 'points'
+# are the only moves which don't lose if the opponent threatens to win,
+# or None if all moves are possible.
+def analyse(board, vcf_depth=10, vct_depth=0, max_nodes=200):
+    color = board.who_turn()
+    defender = _other(color)
+    threats = find_threats(board, color)
+    if threats.fives:
+        return bd.Board.WIN, sorted(threats.fives)
+    blocks = five_points(board, defender)
+    if len(blocks) >= 2:
+        return bd.Board.LOSE, sorted(blocks)
+    if blocks:
+        return bd.Board.NOTHING, sorted(blocks)
+    if vcf_depth > 0 and threats.fours:
+        move = find_vcf(board, vcf_depth, max_nodes)
+        if move is not None:
+            return bd.Board.WIN, [move]
+    if vct_depth > 0 and (threats.fours or threats.threes):
+        move = find_vct(board, vct_depth, max_nodes)
+        if move is not None:
+            return bd.Board.WIN, [move]
+
+    if find_threats(board, defender).open_fours:
+        # Stop the open three, or make a four first.
+        replies = _defences(board, defender)
+        if not replies:
+            return bd.Board.LOSE, None
+        return bd.Board.NOTHING, sorted(replies)
+    return bd.Board.NOTHING, None
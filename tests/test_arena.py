@@ -0,0 +1,54 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import arena  # noqa: E402
+import board as bd  # noqa: E402
+
+
+def _match(wins, ties, losses, min_games=10):
+    match = arena.Match(0, 35, 0.05, 0.05, min_games)
+    for winner, count in ((bd.Board.BLACK, wins), (bd.Board.EMPTY, ties),
+                          (bd.Board.WHITE, losses)):
+        for _ in range(count):
+            match.add(bd.Board.BLACK, winner)
+    return match
+
+
+def test_no_games():
+    assert _match(0, 0, 0).llr() == 0.0
+    assert _match(0, 0, 0).decision() is None
+
+
+def test_all_wins_accept_h1():
+    assert _match(9, 0, 0).decision() is None
+    assert _match(20, 0, 0).decision() == 'H1'
+    assert _match(200, 0, 0).decision() == 'H1'
+
+
+def test_all_losses_accept_h0():
+    assert _match(0, 0, 20).decision() == 'H0'
+    assert _match(0, 0, 200).decision() == 'H0'
+
+
+def test_all_ties_accept_h0():
+    assert _match(0, 200, 0).decision() == 'H0'
+
+
+# A loss after many wins lowers the ratio, it doesn't jump up from 0.
+def test_llr_one_loss():
+    before = _match(30, 0, 0).llr()
+    after = _match(30, 0, 1).llr()
+    assert before > after > 0
+    assert _match(30, 0, 1).decision() == 'H1'
+
+
+def test_llr_grows_with_wins():
+    llrs = [_match(wins, 0, 0).llr() for wins in range(1, 50)]
+    assert all(a < b for a, b in zip(llrs, llrs[1:]))
+
+
+def test_balanced_undecided():
+    assert _match(10, 0, 10).decision() is None
+    assert _match(10, 0, 10).llr() < 0
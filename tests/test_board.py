@@ -0,0 +1,118 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import board as bd  # noqa: E402
+
+DIMEN = bd.Board.BOARD_DIMEN
+
+
+# Number of runs of each length per colour, every direction separately,
+# lengths over MAX_LINE are counted as MAX_LINE.
+def _naive_line_counts(grid):
+    counts = {color: [0] * (bd.Board.MAX_LINE + 1)
+              for color in (bd.Board.BLACK, bd.Board.WHITE)}
+    for row_dir, col_dir in bd.Board.DIR_4:
+        for row in range(DIMEN):
+            for col in range(DIMEN):
+                color = grid[row][col]
+                if color == bd.Board.EMPTY:
+                    continue
+                prev_row, prev_col = row - row_dir, col - col_dir
+                if (0 <= prev_row < DIMEN and 0 <= prev_col < DIMEN and
+                        grid[prev_row][prev_col] == color):
+                    # Not the start of a run.
+                    continue
+                length = 0
+                cur_row, cur_col = row, col
+                while (0 <= cur_row < DIMEN and 0 <= cur_col < DIMEN and
+                       grid[cur_row][cur_col] == color):
+                    length += 1
+                    cur_row += row_dir
+                    cur_col += col_dir
+                counts[color][min(length, bd.Board.MAX_LINE)] += 1
+    return counts
+
+
+# Zobrist hash of 'grid' under every symmetry, as 'Board' keeps them.
+def _naive_hashes(grid, moves):
+    hashes = []
+    for symmetry in bd.Board.SYMMETRY:
+        key = bd.Board.ZOBRIST_TURN if moves % 2 else 0
+        for row in range(DIMEN):
+            for col in range(DIMEN):
+                color = grid[row][col]
+                if color != bd.Board.EMPTY:
+                    key ^= bd.Board.ZOBRIST[color][symmetry[row * DIMEN +
+                                                            col]]
+        hashes.append(key)
+    return hashes
+
+
+def _naive_is_five(grid, row, col):
+    color = grid[row][col]
+    for row_dir, col_dir in bd.Board.DIR_4:
+        length = 1
+        for sign in (1, -1):
+            cur_row, cur_col = row + sign * row_dir, col + sign * col_dir
+            while (0 <= cur_row < DIMEN and 0 <= cur_col < DIMEN and
+                   grid[cur_row][cur_col] == color):
+                length += 1
+                cur_row += sign * row_dir
+                cur_col += sign * col_dir
+        if length >= 5:
+            return True
+    return False
+
+
+def _check_state(board, grid, moves):
+    counts = _naive_line_counts(grid)
+    for color in (bd.Board.BLACK, bd.Board.WHITE):
+        for length in range(1, bd.Board.MAX_LINE + 1):
+            assert board.line_count(color, length) == counts[color][length]
+    hashes = _naive_hashes(grid, moves)
+    assert board.get_hash() == hashes[0]
+    assert board.get_symmetric_hashes().tolist() == hashes
+    assert board.get_canonical_hash()[0] == min(hashes)
+    assert board._board.tolist() == grid
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_play_undo_matches_naive_scan(seed):
+    rand = random.Random(seed)
+    board = bd.Board()
+    grid = [[bd.Board.EMPTY] * DIMEN for _ in range(DIMEN)]
+    points = [(row, col) for row in range(DIMEN) for col in range(DIMEN)]
+    rand.shuffle(points)
+    played = []
+    for row, col in points:
+        grid[row][col] = board.who_turn()
+        status = board.play(row, col)
+        played.append((row, col))
+        _check_state(board, grid, len(played))
+        win = _naive_is_five(grid, row, col)
+        assert status == (bd.Board.WIN if win else bd.Board.NOTHING)
+        if win:
+            break
+
+    for moves, (row, col) in reversed(list(enumerate(played))):
+        board.undo(row, col)
+        grid[row][col] = bd.Board.EMPTY
+        _check_state(board, grid, moves)
+    assert board._lines == bd.Board()._lines
+
+
+def test_pass_toggles_turn_hash():
+    board = bd.Board()
+    board.play(7, 7)
+    key = board.get_hash()
+    assert board.play(-1, -1) == bd.Board.NOTHING
+    assert board.get_hash() == key ^ bd.Board.ZOBRIST_TURN
+    assert board.play(-1, -1) == bd.Board.TIE
+    board.undo(-1, -1)
+    board.undo(-1, -1)
+    assert board.get_hash() == key
@@ -0,0 +1,123 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import board as bd  # noqa: E402
+import tactics  # noqa: E402
+
+
+def _point(row, col):
+    return row * bd.Board.BOARD_DIMEN + col
+
+
+# Board with 'black' and 'white' stones as [row, col], and 'to_move' to
+# play. Missing moves of a side are passes.
+def _board(black, white, to_move=bd.Board.BLACK):
+    board = bd.Board()
+    black = list(black)
+    white = list(white)
+    while black or white:
+        stones = black if board.who_turn() == bd.Board.BLACK else white
+        move = stones.pop(0) if stones else (-1, -1)
+        assert board.play(*move) != bd.Board.WIN
+    if board.who_turn() != to_move:
+        board.play(-1, -1)
+    return board
+
+
+# 'analyse' must leave the board as it was.
+def _analyse(board, **kwargs):
+    key = board.get_hash()
+    lines = [list(lines) for lines in board._lines]
+    result = tactics.analyse(board, **kwargs)
+    assert board.get_hash() == key
+    assert board._lines == lines
+    return result
+
+
+def test_own_four_wins():
+    board = _board([(7, 5), (7, 6), (7, 7), (7, 8)],
+                   [(0, 0), (0, 2), (0, 4)])
+    assert _analyse(board) == (bd.Board.WIN, [_point(7, 4), _point(7, 9)])
+
+
+def test_blocked_four_wins_at_the_open_end():
+    board = _board([(7, 5), (7, 6), (7, 7), (7, 8)],
+                   [(7, 4), (0, 2), (0, 4)])
+    assert _analyse(board) == (bd.Board.WIN, [_point(7, 9)])
+
+
+def test_opponent_four_must_be_blocked():
+    board = _board([(0, 0), (0, 2), (0, 6), (14, 14)],
+                   [(7, 3), (7, 5), (7, 6), (7, 7)])
+    # White has a broken four 3, 5-7, its only five point is 7, 4.
+    assert _analyse(board) == (bd.Board.NOTHING, [_point(7, 4)])
+
+
+def test_opponent_open_four_loses():
+    board = _board([(0, 0), (0, 2), (0, 6), (14, 14)],
+                   [(7, 4), (7, 5), (7, 6), (7, 7)])
+    status, points = _analyse(board)
+    assert status == bd.Board.LOSE
+    assert points == [_point(7, 3), _point(7, 8)]
+
+
+def test_opponent_open_three_is_stopped_at_its_ends():
+    board = _board([(0, 0), (0, 4), (14, 14)],
+                   [(7, 6), (7, 7), (7, 8)])
+    assert _analyse(board) == (bd.Board.NOTHING,
+                               [_point(7, 5), _point(7, 9)])
+
+
+def test_broken_three_can_be_stopped_in_the_gap():
+    board = _board([(0, 0), (0, 4), (14, 14)],
+                   [(7, 5), (7, 7), (7, 8)])
+    assert _analyse(board) == (bd.Board.NOTHING,
+                               [_point(7, 4), _point(7, 6), _point(7, 9)])
+
+
+def test_double_four_is_a_vcf():
+    # Both fours are blocked at one end, (7, 7) makes two of them.
+    board = _board([(7, 4), (7, 5), (7, 6), (4, 7), (5, 7), (6, 7)],
+                   [(7, 3), (3, 7), (0, 0), (0, 2), (0, 4), (14, 14)])
+    assert _analyse(board) == (bd.Board.WIN, [_point(7, 7)])
+    board.play(7, 7)
+    assert tactics.five_points(board, bd.Board.BLACK) == {_point(7, 8),
+                                                          _point(8, 7)}
+
+
+def test_single_blocked_four_is_no_vcf():
+    board = _board([(7, 4), (7, 5), (7, 6), (12, 12)],
+                   [(7, 3), (0, 0), (0, 2), (0, 4)])
+    assert _analyse(board) == (bd.Board.NOTHING, None)
+
+
+def test_own_open_three_wins_by_an_open_four():
+    board = _board([(7, 6), (7, 7), (7, 8)],
+                   [(0, 0), (0, 4), (14, 14)])
+    status, points = _analyse(board)
+    assert status == bd.Board.WIN
+    assert points[0] in (_point(7, 5), _point(7, 9))
+
+
+def test_double_three_is_only_a_vct():
+    # (7, 8) makes two open threes, there is no four to play.
+    board = _board([(7, 6), (7, 7), (5, 8), (6, 8)],
+                   [(0, 0), (0, 4), (14, 10), (14, 14)])
+    assert _analyse(board) == (bd.Board.NOTHING, None)
+    assert _analyse(board, vct_depth=3)[0] == bd.Board.WIN
+
+
+def test_vcf_moves_are_sound():
+    # Every claimed first move leaves the defender no reply which stops
+    # the attack: checked by playing the defender's forced blocks.
+    board = _board([(7, 4), (7, 5), (7, 6), (4, 7), (5, 7), (6, 7)],
+                   [(7, 3), (3, 7), (0, 0), (0, 2), (0, 4), (14, 14)])
+    move = tactics.find_vcf(board)
+    assert move is not None
+    board.play(*divmod(move, bd.Board.BOARD_DIMEN))
+    for block in sorted(tactics.five_points(board, bd.Board.BLACK)):
+        board.play(*divmod(block, bd.Board.BOARD_DIMEN))
+        assert tactics.five_points(board, bd.Board.BLACK)
+        board.undo(*divmod(block, bd.Board.BOARD_DIMEN))
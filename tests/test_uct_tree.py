@@ -0,0 +1,41 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import board as bd  # noqa: E402
+import uct_tree  # noqa: E402
+
+
+def _policy(priors):
+    policy = np.zeros(bd.Board.PASS_POINT + 1, dtype=np.float32)
+    for point, prior in priors.items():
+        policy[point] = prior
+    return policy
+
+
+def test_prune_by_prior_top_k_and_keep():
+    policy = _policy({0: 0.5, 1: 0.3, 2: 0.15, 3: 0.05})
+    points = np.arange(4, dtype=np.intp)
+    keep = np.array([3], dtype=np.intp)
+    pruned = uct_tree._prune_by_prior(policy, points, 2, None, keep)
+    assert pruned.tolist() == [0, 1, 3]
+
+
+def test_prune_by_prior_top_p():
+    policy = _policy({0: 0.5, 1: 0.3, 2: 0.15, 3: 0.05})
+    points = np.arange(4, dtype=np.intp)
+    keep = np.array([], dtype=np.intp)
+    pruned = uct_tree._prune_by_prior(policy, points, None, 0.7, keep)
+    assert pruned.tolist() == [0, 1]
+
+
+# A full board has no legal points, only PASS is left.
+def test_prune_by_prior_no_points():
+    policy = _policy({bd.Board.PASS_POINT: 1.0})
+    points = np.array([], dtype=np.intp)
+    keep = np.array([], dtype=np.intp)
+    pruned = uct_tree._prune_by_prior(policy, points, 5, 0.9, keep)
+    assert len(pruned) == 0
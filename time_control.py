@@ -0,0 +1,35 @@
+# Split a total thinking time over the moves of one player in a game.
+# The game length is not known, so every move gets an equal share of the
+# remaining time over the moves expected to be left, never fewer than
+# 'min_moves_left', plus the increment.
+class GameClock(object):
+    # Never use more than this part of the remaining time on one move.
+    MAX_FRACTION = 0.5
+
+    def __init__(self, total, increment=0.0, expected_moves=40,
+                 min_moves_left=10):
+        self._total = total
+        self._increment = increment
+        self._expected_moves = expected_moves
+        self._min_moves_left = min_moves_left
+        self.restart()
+
+    def restart(self):
+        self._remaining = self._total
+        self._moves = 0
+
+    def remaining(self):
+        return self._remaining
+
+    # Return seconds to think about the next move.
+    def allocate(self):
+        moves_left = max(self._min_moves_left,
+                         self._expected_moves - self._moves)
+        budget = self._remaining / moves_left + self._increment
+        return max(0.0, min(budget, self._remaining * self.MAX_FRACTION))
+
+    # Take the time used by a move off the clock.
+    def consume(self, seconds):
+        self._remaining = max(0.0, self._remaining - seconds) + \
+            self._increment
+        self._moves += 1
@@ -0,0 +1,266 @@
+import glob
+import os
+import queue
+import struct
+import threading
+
+import numpy as np
+
+import board as bd
+
+
+# Training data written by self-play.
+#
+# Positions are stored as fixed size records in append-only shard files,
+# every shard starts with a small header and can be memory-mapped as an
+# array of records. A record is:
+#   stones: black and white stone planes, 2 * 225 bits packed in 57 bytes
+#   turn:   side to move, Board.BLACK or Board.WHITE
+#   result: +1 if the player who just moved wins the game, -1 if loses,
+#           0 for a tie. Same view as the value output used by UctTree.
+#   visits: MCTS visit count of every move, 225 is PASS
+POINTS = bd.Board.BOARD_DIMEN * bd.Board.BOARD_DIMEN
+RECORD_DTYPE = np.dtype([('stones', np.uint8, ((2 * POINTS + 7) // 8,)),
+                         ('turn', np.uint8),
+                         ('result', np.int8),
+                         ('pad', np.uint8),
+                         ('visits', np.uint16, (POINTS + 1,))])
+MAGIC = b'GMKREC01'
+HEADER_SIZE = 16
+SHARD_SUFFIX = '.gmk'
+# [symmetry][point] is the point which is moved to 'point',
+# the inverse of 'Board.SYMMETRY_INDEX'.
+INVERSE_SYMMETRY = np.argsort(bd.Board.SYMMETRY_INDEX, axis=1)
+
+
+# Magic, record size and a reserved field.
+def _header():
+    return MAGIC + struct.pack('<II', RECORD_DTYPE.itemsize, 0)
+
+
+class GameRecord(object):
+    # Positions of one game, kept until the result is known.
+    def __init__(self):
+        self._records = []
+
+    # Add the position on 'board' with the visit counts of its moves,
+    # 'visits' is indexed by point as returned by 'UctTree.get_visits'.
+    def add(self, board, visits):
+        record = np.zeros((), dtype=RECORD_DTYPE)
+        stones = np.stack([board._board == bd.Board.BLACK,
+                           board._board == bd.Board.WHITE])
+        record['stones'] = np.packbits(stones.ravel())
+        record['turn'] = board.who_turn()
+        record['visits'] = np.minimum(visits, np.iinfo(np.uint16).max)
+        self._records.append(record)
+
+    # Return all records with result filled in, 'winner' is the colour
+    # which won or Board.EMPTY for a tie.
+    def finish(self, winner):
+        records = np.array(self._records, dtype=RECORD_DTYPE)
+        if winner != bd.Board.EMPTY:
+            # The player who just moved is the one not to move.
+            records['result'] = np.where(records['turn'] == winner, -1, 1)
+        return records
+
+
+class RecordWriter(object):
+    # Append records to shard files '<prefix>-<index>.gmk' in 'directory',
+    # a new shard is started every 'shard_size' records. Existing shards
+    # are never written again, so several writers can share a directory
+    # if their prefixes are different.
+    def __init__(self, directory, prefix='selfplay', shard_size=100000):
+        self._directory = directory
+        self._prefix = prefix
+        self._shard_size = shard_size
+        self._file = None
+        self._count = 0
+        self._index = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_next_shard(self):
+        self.close()
+        while True:
+            path = os.path.join(self._directory, '{}-{:05d}{}'.format(
+                self._prefix, self._index, SHARD_SUFFIX))
+            self._index += 1
+            if not os.path.exists(path):
+                break
+        self._file = open(path, 'wb')
+        self._file.write(_header())
+        self._count = 0
+
+    def write(self, records):
+        start = 0
+        while start < len(records):
+            if self._file is None or self._count >= self._shard_size:
+                self._open_next_shard()
+            size = min(len(records) - start, self._shard_size - self._count)
+            self._file.write(records[start:start + size].tobytes())
+            self._count += size
+            start += size
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Return memory-mapped records of a shard. A record which is only partly
+# written, e.g. by a killed writer, is ignored.
+def open_shard(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a training data shard: ' + path)
+    record_size, _ = struct.unpack('<II', header[len(MAGIC):])
+    if record_size != RECORD_DTYPE.itemsize:
+        raise ValueError('unknown record size in ' + path)
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r',
+                     offset=HEADER_SIZE, shape=(count,))
+
+
+# Decode records to network input, policy and value targets.
+def decode(records):
+    size = len(records)
+    dimen = bd.Board.BOARD_DIMEN
+    stones = np.unpackbits(records['stones'], axis=1)[:, :2 * POINTS]
+    stones = stones.reshape(size, 2, dimen, dimen)
+
+    x = np.empty((size, dimen, dimen, 5), dtype=np.float32)
+    x[:, :, :, 0] = stones[:, 0]
+    x[:, :, :, 1] = stones[:, 1]
+    x[:, :, :, 2] = 1 - stones[:, 0] - stones[:, 1]
+    black_turn = (records['turn'] == bd.Board.BLACK)[:, np.newaxis,
+                                                       np.newaxis]
+    x[:, :, :, 3] = black_turn
+    x[:, :, :, 4] = ~black_turn
+
+    policy = records['visits'].astype(np.float32)
+    total = policy.sum(axis=1, keepdims=True)
+    policy /= np.maximum(total, 1)
+    value = records['result'].astype(np.float32).reshape(size, 1)
+    return x, policy, value
+
+
+# Move every sample of a batch by a random one of the 8 board symmetries.
+# Input planes and policy are moved together, PASS stays in place.
+def augment(x, policy, rand):
+    size = len(x)
+    dimen = bd.Board.BOARD_DIMEN
+    inverse = INVERSE_SYMMETRY[rand.randint(0, len(INVERSE_SYMMETRY), size)]
+    policy = np.take_along_axis(policy, inverse, axis=1)
+    x = np.take_along_axis(x.reshape(size, POINTS, 5),
+                           inverse[:, :POINTS, np.newaxis], axis=1)
+    return x.reshape(size, dimen, dimen, 5), policy
+
+
+class BatchPrefetcher(object):
+    # Iterate over 'count' batches made by 'make_batch(index, rand)' in
+    # background threads, so the next batches are prepared while the
+    # caller works on the current one. Batches may come in any order,
+    # every thread has its own 'rand'.
+    def __init__(self, make_batch, count, capacity=4, threads=2, seed=None):
+        self._make_batch = make_batch
+        self._count = count
+        self._remaining = count
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(capacity)
+        self._stop = threading.Event()
+        seeds = np.random.RandomState(seed).randint(0, 2 ** 31, threads)
+        self._threads = [threading.Thread(target=self._work,
+                                          args=(np.random.RandomState(s),),
+                                          daemon=True)
+                         for s in seeds]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self, rand):
+        while not self._stop.is_set():
+            with self._lock:
+                if self._remaining == 0:
+                    return
+                self._remaining -= 1
+                index = self._count - self._remaining - 1
+            try:
+                item = self._make_batch(index, rand)
+            except Exception as e:
+                item = e
+            while not self._stop.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def __iter__(self):
+        try:
+            for _ in range(self._count):
+                item = self._queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+
+
+class TrainingData(object):
+    # Training data over memory-mapped shards, used by 'Network.train'.
+    # Only the records of a requested batch are read from disk.
+    def __init__(self, paths, seed=None):
+        if isinstance(paths, str):
+            paths = sorted(glob.glob(os.path.join(paths,
+                                                  '*' + SHARD_SUFFIX)))
+        self._shards = [shard for shard in map(open_shard, paths)
+                        if len(shard) > 0]
+        sizes = [len(shard) for shard in self._shards]
+        # Global index of the first record of every shard.
+        self._starts = np.cumsum([0] + sizes)
+        self.data_size = int(self._starts[-1])
+        self._random = np.random.RandomState(seed)
+
+    # Return records at global 'indices'.
+    def _records(self, indices):
+        records = np.empty(len(indices), dtype=RECORD_DTYPE)
+        shard_ids = np.searchsorted(self._starts, indices, side='right') - 1
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            local = indices[mask] - self._starts[shard_id]
+            records[mask] = self._shards[shard_id][local]
+        return records
+
+    # Return [input, policy, value] of records [start, start + size).
+    def get_data(self, start, size):
+        indices = np.arange(start, min(start + size, self.data_size))
+        return decode(self._records(indices))
+
+    # Return [input, policy, value] of 'size' random records.
+    def get_random_data(self, size):
+        indices = self._random.randint(0, self.data_size, size)
+        return decode(self._records(indices))
+
+    # Return an iterator over one epoch of shuffled batches of
+    # [input, policy, value], which are prepared in background threads.
+    # Every sample is moved by a random symmetry if 'augmented'.
+    def batches(self, batch_size, augmented=True, prefetch=4, threads=2):
+        order = self._random.permutation(self.data_size)
+
+        def make_batch(index, rand):
+            indices = np.sort(order[index * batch_size:
+                                    (index + 1) * batch_size])
+            x, policy, value = decode(self._records(indices))
+            if augmented:
+                x, policy = augment(x, policy, rand)
+            return x, policy, value
+
+        return BatchPrefetcher(make_batch, self.data_size // batch_size,
+                               prefetch, threads,
+                               self._random.randint(0, 2 ** 31))
@@ -0,0 +1,88 @@
+import collections
+import numpy as np
+
+import board as bd
+
+
+class TranspositionTable(object):
+    # Cache of network results [policy, value] in front of the network.
+    # The same position is reached by many move orders, and the 8
+    # symmetries of a position are the same position for the network, so
+    # each of them only needs one evaluation.
+    # Policies are stored in the orientation of the canonical position
+    # and moved back to the orientation of the query when looked up.
+    # When the memory limit is reached the least recently used entry
+    # is dropped.
+    # Estimated bytes of everything in an entry except the policy data:
+    # the dict slot, key, tuple, value and array header.
+    ENTRY_OVERHEAD = 300
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, symmetric=True):
+        self._max_bytes = max_bytes
+        self._symmetric = symmetric
+        self._table = collections.OrderedDict()
+        self._bytes = 0
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._table)
+
+    # Return [key, symmetry] of the position on 'board',
+    # used by 'lookup' and 'store'.
+    def key_of(self, board):
+        if self._symmetric:
+            return board.get_canonical_hash()
+        return board.get_hash(), 0
+
+    # Return [policy, value] of 'key', or None if it is not cached.
+    # 'symmetry' is the one returned by 'key_of' together with 'key'.
+    def lookup(self, key, symmetry):
+        entry = self._table.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._table.move_to_end(key)
+        self.hits += 1
+        policy, value = entry
+        if symmetry != 0:
+            policy = policy[bd.Board.SYMMETRY_INDEX[symmetry]]
+        return policy, value
+
+    def store(self, key, symmetry, policy, value):
+        if key in self._table:
+            self._table.move_to_end(key)
+            return
+        # Always a new array, so the entry doesn't keep the whole batch
+        # output alive.
+        canonical = np.empty_like(policy)
+        canonical[bd.Board.SYMMETRY_INDEX[symmetry]] = policy
+        policy = canonical
+        self._table[key] = (policy, value)
+        self._bytes += self._entry_bytes(policy)
+        while self._bytes > self._max_bytes and self._table:
+            _, (old_policy, _) = self._table.popitem(last=False)
+            self._bytes -= self._entry_bytes(old_policy)
+
+    def _entry_bytes(self, policy):
+        return policy.nbytes + self.ENTRY_OVERHEAD
+
+    def clear(self):
+        self._table.clear()
+        self._bytes = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    # Estimated memory used by the cached entries in bytes.
+    def memory_usage(self):
+        return self._bytes
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hit_rate(), 'size': len(self._table),
+                'bytes': self._bytes}
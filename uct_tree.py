@@ -1,12 +1,30 @@
-import network as net
 import board as bd
+import numpy_network
+import search_stats
+import tactics
+import transposition
+import numpy as np
 import copy
+import math
+import queue
+import threading
+import time
 
 
 class Node(object):
     # UCT Node.
     # NOTE: This class is very size-sensitive.
-    def __init__(self, move, row, col, nn_policy, nn_value, parent):
+    # Children which are not expanded yet are only an entry of the packed
+    # '_child_*' arrays, expanded children are also in '_children' by their
+    # index. Visit count and eval of every child are kept in the parent's
+    # arrays as well, so selection doesn't need to touch child nodes.
+    __slots__ = ('_row', '_col', '_nn_value', '_nn_polivy', '_visit_count',
+                 '_mcts_eval', '_move', '_parent', '_index', '_child_moves',
+                 '_child_priors', '_child_visits', '_child_evals',
+                 '_children', '_pruned')
+
+    def __init__(self, move, row, col, nn_policy, nn_value, parent,
+                 index=-1):
         self._row = row
         self._col = col
         self._nn_value = nn_value
@@ -15,116 +33,712 @@ class Node(object):
         self._mcts_eval = 0.0
         self._move = move
         self._parent = parent
-        self._children = []
+        # Index in the parent's child arrays.
+        self._index = index
+        self._child_moves = None
+        self._child_priors = None
+        self._child_visits = None
+        self._child_evals = None
+        self._children = None
+        # True if moves were left out by distance or prior, so the node
+        # can't be proven by all of its children losing.
+        self._pruned = False
 
     # Create all legal children.
-    # Each child could be a real pointer is child exist,
-    # or just an array which includes [row, col, nn_policy].
-    # nn_policy[225] is 'PASS' move.
-    def create_children(self, nn_policy, current_board):
-        legal_sum = 0.0
-        DIMEN = current_board.BOARD_DIMEN
-        for row in range(DIMEN):
-            for col in range(DIMEN):
-                if current_board.is_legal_move(row, col):
-                    pos = row * DIMEN + col
-                    self._children.append([row, col, nn_policy[pos]])
-                    legal_sum += nn_policy[pos]
-        self._children.append([-1, -1, nn_policy[225]])
-        legal_sum += nn_policy[225]
+    # 'legal_points' are the empty points as row * 15 + col,
+    # PASS is added as point 225 if 'with_pass', same as nn_policy[225].
+    def create_children(self, nn_policy, legal_points, with_pass=True):
+        if with_pass:
+            legal_points = np.append(legal_points, bd.Board.PASS_POINT)
+        self._child_moves = np.asarray(legal_points, dtype=np.int16)
+        self._child_priors = nn_policy[self._child_moves].astype(np.float32)
+        self._child_visits = np.zeros(len(self._child_moves),
+                                      dtype=np.float32)
+        self._child_evals = np.zeros(len(self._child_moves),
+                                     dtype=np.float32)
+        self._children = {}
 
+        legal_sum = self._child_priors.sum()
         if legal_sum > 0.00001:
             # Re-normalize after removing illegal moves.
-            for child in self._children:
-                child[2] /= legal_sum
+            self._child_priors /= legal_sum
         else:
             # This can happen with new randomized nets.
-            policy = 1.0 / len(self._children)
-            for child in self._children:
-                child[2] = policy
+            self._child_priors[:] = 1.0 / len(self._child_moves)
+
+    # Return [row, col] of child 'idx'.
+    def child_move(self, idx):
+        point = int(self._child_moves[idx])
+        if point == bd.Board.PASS_POINT:
+            return -1, -1
+        return divmod(point, bd.Board.BOARD_DIMEN)
+
+    # Return index of the child which plays at [row, col], -1 if not found.
+    def find_child(self, row, col):
+        if row == -1 and col == -1:
+            point = bd.Board.PASS_POINT
+        else:
+            point = row * bd.Board.BOARD_DIMEN + col
+        found = np.flatnonzero(self._child_moves == point)
+        return int(found[0]) if len(found) > 0 else -1
 
     def _get_win_rate(self):
         return ((self._visit_count + self._mcts_eval) /
                 (self._visit_count * 2.0))
 
-    def select_child(self):
-        best = -1
-        best_value = 0.0
-        for idx, child in enumerate(self._children):
-            # Get win rate.
-            if type(child) is Node:
-                if child._visit_count > 0:
-                    win_rate = child._get_win_rate()
-                    child_visit = child._visit_count
-                else:
-                    win_rate = 1 - self._nn_value
-                    child_visit = 0
-                child_policy = child._nn_polivy
-            else:
-                # Using current winrate if not append yet.
-                win_rate = 1 - self._nn_value
-                child_visit = 0
-                child_policy = child[2]
-
-            # Uct value
-            value = win_rate + (child_policy / (1 + child_visit))
+    # PUCT selection, return index of the child with the best
+    # win rate + c_puct * prior * sqrt(parent visits) / (1 + child visits).
+    # Children without visits use the current win rate.
+    def select_child(self, c_puct):
+        visits = self._child_visits
+        win_rate = ((visits + self._child_evals) /
+                    np.maximum(visits + visits, 1))
+        # Using current winrate if not visited yet.
+        win_rate[visits == 0] = 1 - self._nn_value
 
-            if value > best_value:
-                best_value = value
-                best = idx
-
-        return best
+        # Uct value
+        explore = c_puct * math.sqrt(max(self._visit_count, 1))
+        win_rate += self._child_priors * (explore / (1 + visits))
+        return int(win_rate.argmax())
 
     def update(self, mcts_eval):
         self._visit_count += 1
         self._mcts_eval += mcts_eval
+        if self._parent is not None:
+            self._parent._child_visits[self._index] += 1
+            self._parent._child_evals[self._index] += mcts_eval
+
+    # Virtual loss counts as lost visits, so other descents of the same
+    # batch are pushed to different paths until the real result arrives.
+    def add_virtual_loss(self, virtual_loss):
+        self._visit_count += virtual_loss
+        self._mcts_eval -= virtual_loss
+        if self._parent is not None:
+            self._parent._child_visits[self._index] += virtual_loss
+            self._parent._child_evals[self._index] -= virtual_loss
+
+    def revert_virtual_loss(self, virtual_loss):
+        self._visit_count -= virtual_loss
+        self._mcts_eval += virtual_loss
+        if self._parent is not None:
+            self._parent._child_visits[self._index] -= virtual_loss
+            self._parent._child_evals[self._index] += virtual_loss
+
+    # Return the number of nodes in this subtree, itself included.
+    def subtree_size(self):
+        size = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            size += 1
+            if node._children:
+                stack.extend(node._children.values())
+        return size
+
+    # A node is pending when it is created during a batched search
+    # and still waiting for network evaluation.
+    def is_pending(self):
+        return self._nn_value is None
+
+    # Return the result of a game ended or proven by tactics at this node,
+    # 1 if the player who moved to it wins, -1 if loses, None if unknown.
+    # Such a node is a leaf.
+    def proven_value(self):
+        if self._child_moves is None and self._nn_value in (1.0, -1.0):
+            return self._nn_value
+        return None
+
+
+# Return the points of the highest priors in 'policy', at most 'top_k' of
+# them and just enough to reach 'top_p' of the prior of all 'points'.
+# Points in 'keep' are always kept. None is no limit.
+def _prune_by_prior(policy, points, top_k, top_p, keep):
+    if len(points) == 0:
+        return keep
+    priors = policy[points]
+    order = np.argsort(-priors, kind='stable')
+    count = len(points)
+    if top_p is not None:
+        cumulative = np.cumsum(priors[order])
+        count = min(count, int(np.searchsorted(
+            cumulative, top_p * cumulative[-1])) + 1)
+    if top_k is not None:
+        count = min(count, top_k)
+    return np.union1d(points[order[:count]], keep).astype(points.dtype)
+
+
+# Clear the links of every node below 'node' to its parent and children,
+# so the nodes are freed without waiting for the cyclic garbage collector.
+def _unlink(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        node._parent = None
+        if node._children:
+            stack.extend(node._children.values())
+        node._children = None
+
+
+# Drop released subtrees, so freeing a big tree doesn't block the caller.
+def _release_worker(release_queue):
+    while True:
+        _unlink(release_queue.get())
+
+
+# Returned by 'UctTree._descend' when the descent run into a pending leaf.
+_COLLISION = object()
+
+
+class BatchedEvaluator(object):
+    # Evaluate the positions of several search threads together. A batch
+    # is sent to 'network' when 'max_batch' positions wait, or 'timeout'
+    # seconds after the first one.
+    def __init__(self, network, max_batch, timeout=0.001):
+        self._network = network
+        self._max_batch = max_batch
+        self._timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    # Return [policy, value] of the input 'data' of one position.
+    def evaluate(self, data):
+        done = threading.Event()
+        result = [None]
+        self._queue.put((data, done, result))
+        done.wait()
+        if isinstance(result[0], Exception):
+            raise result[0]
+        return result[0]
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            items = [item]
+            deadline = time.time() + self._timeout
+            while len(items) < self._max_batch:
+                try:
+                    item = self._queue.get(
+                        timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                items.append(item)
+            try:
+                policies, values = self._network.evaluate(
+                    np.stack([data for data, _, _ in items]))
+                results = zip(policies, values)
+            except Exception as e:
+                results = [e] * len(items)
+            for (_, done, result), each in zip(items, results):
+                result[0] = each
+                done.set()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+# Graph seed of the random weights used if no network path is given, the
+# same in every tree and process so their searches can be compared.
+RANDOM_NET_SEED = 0
+
+
+# Return the network at 'net_path'. An '.npz' path is run by NumPy and
+# TensorFlow is not imported, a '.pb' path is an exported inference graph,
+# otherwise it is a checkpoint. Random weights seeded by 'RANDOM_NET_SEED'
+# if 'net_path' is None.
+def _load_network(net_path, threads=None):
+    if net_path is not None and net_path.endswith('.npz'):
+        return numpy_network.NumpyNetwork(net_path)
+    import network as net
+    return net.load_network(net_path, threads, RANDOM_NET_SEED)
 
 
 class UctTree(object):
     """docstring for UctTree"""
-    def __init__(self, net_path='nn/net'):
-        self._network = net.Network()
-        self._network.set_up()
-        self._board = bd.Board()
-        if net_path is not None:
-            self._network.load(net_path)
+    VIRTUAL_LOSS = 1
+    # Evict until the tree is this ratio of the node budget.
+    EVICT_RATIO = 0.8
+    # Length of a round of the pondering search, the tree is locked
+    # during a round.
+    PONDER_SECONDS = 0.02
+
+    # If 'node_budget' is set, the tree is kept under that many nodes.
+    # When it is full the least visited subtrees are evicted, or the
+    # search stops if 'evict_on_budget' is False.
+    # If 'use_tactics', every new node is checked by 'tactics.analyse'
+    # with the given bounds: proven wins and losses become leaves with a
+    # fixed result, and only the forced moves are expanded if the
+    # opponent threatens to win.
+    # Children can be pruned to the points at most 'near_distance' rows
+    # and columns from a stone, and to the best priors by 'top_k' and
+    # 'top_p', see '_prune_by_prior'. None is no pruning. Fives, fours
+    # and open threes of both sides are always kept.
+    # If 'instrument', the phases of the search are counted and timed,
+    # see 'get_stats'.
+    def __init__(self, net_path='nn/net', cache_bytes=64 * 1024 * 1024,
+                 symmetric_cache=True, c_puct=1.0, node_budget=None,
+                 evict_on_budget=True, release_in_background=False,
+                 network_threads=None, use_tactics=True, vcf_depth=10,
+                 vct_depth=0, tactics_nodes=200, near_distance=None,
+                 top_k=None, top_p=None, instrument=False):
+        self._c_puct = c_puct
+        self._stats = search_stats.SearchStats() if instrument else None
+        self._near_distance = near_distance
+        self._top_k = top_k
+        self._top_p = top_p
+        self._use_tactics = use_tactics
+        self._vcf_depth = vcf_depth
+        self._vct_depth = vct_depth
+        self._tactics_nodes = tactics_nodes
+        self._node_budget = node_budget
+        self._evict_on_budget = evict_on_budget
+        self._release_queue = None
+        if release_in_background:
+            self._release_queue = queue.Queue()
+            threading.Thread(target=_release_worker,
+                             args=(self._release_queue,),
+                             daemon=True).start()
+        self._root = None
+        self._network = _load_network(net_path, network_threads)
+        self._board = bd.Board(2 if near_distance is None
+                               else near_distance)
+        # Network results of known positions, kept across moves and games.
+        self._tt = transposition.TranspositionTable(cache_bytes,
+                                                    symmetric_cache)
+        # Background search, see 'start_pondering'.
+        self._lock = threading.RLock()
+        self._ponder_thread = None
+        self._ponder_stop = threading.Event()
+        self._ponder_stats = None
+        self._ponder_error = None
 
         self.restart()
 
+    # Return [policy, value] of 'board', the network is only called
+    # if the position is not in the transposition table.
+    def _evaluate(self, board):
+        key, symmetry = self._tt.key_of(board)
+        entry = self._tt.lookup(key, symmetry)
+        if entry is None:
+            policy, value = self._network.evaluate(
+                board.get_data_for_network()[np.newaxis])
+            entry = (policy[0], value[0])
+            self._tt.store(key, symmetry, *entry)
+        return entry
+
     # Create a new node and return it.
-    def _create_node(self, move, row, col, cur_policy, board, parent):
-        data = board.get_data_for_network()
-        policy = self._network.output_policy(data)
-        value = self._network.output_value(data)
+    def _create_node(self, move, row, col, cur_policy, board, parent,
+                     index=-1):
+        policy, value = self._evaluate(board)
 
-        new_node = Node(move, row, col, cur_policy, value, parent)
-        new_node.create_children(policy, board)
+        new_node = Node(move, row, col, cur_policy, value, parent, index)
+        _, points = self._solve(board)
+        self._expand(new_node, policy, self._child_points(board, points))
         return new_node
 
+    # Return [value, points] of the position on 'board' by tactics.
+    # 'value' is the proven result for the player who just moved, None if
+    # unknown. 'points' are the only moves worth searching, None for all.
+    def _solve(self, board):
+        if not self._use_tactics:
+            return None, None
+        status, points = tactics.analyse(board, self._vcf_depth,
+                                         self._vct_depth,
+                                         self._tactics_nodes)
+        if status == bd.Board.WIN:
+            return -1.0, points
+        if status == bd.Board.LOSE:
+            return 1.0, points
+        return None, points
+
+    # Return [legal_points, with_pass, keep] to create children of
+    # 'points', 'keep' are the points which are not pruned.
+    # PASS loses if the moves are restricted by tactics, so it is only
+    # added with all legal moves.
+    def _child_points(self, board, points):
+        if points is not None:
+            return np.array(points), False, None
+        if (self._near_distance is None and self._top_k is None and
+                self._top_p is None):
+            return board.legal_points(), True, None
+        keep = np.array(sorted(tactics.threat_points(board)),
+                        dtype=np.intp)
+        if self._near_distance is None:
+            return board.legal_points(), True, keep
+        return np.union1d(board.candidate_points(), keep), True, keep
+
+    # Create children of 'node' from '_child_points', pruned by prior.
+    def _expand(self, node, policy, children):
+        points, with_pass, keep = children
+        if keep is not None and (self._top_k is not None or
+                                 self._top_p is not None):
+            points = _prune_by_prior(policy, points, self._top_k,
+                                     self._top_p, keep)
+        # Moves restricted by tactics are all moves which don't lose.
+        node._pruned = keep is not None
+        node.create_children(policy, points, with_pass)
+
     def restart(self):
+        self.stop_pondering()
         self._board.clear()
+        old_root = self._root
         self._root = self._create_node(0, -1, -1, 0, self._board, None)
         self._cur_node = self._root
+        self._node_count = 1
+        if old_root is not None:
+            self._release(old_root)
 
-    def mcts_visit(self, visit):
+    # Drop a detached subtree, in the background thread if enabled.
+    def _release(self, node):
+        if self._release_queue is not None:
+            self._release_queue.put(node)
+        else:
+            _unlink(node)
+
+    def get_node_count(self):
+        return self._node_count
+
+    # Remove the least visited subtrees until at most 'target' nodes left.
+    # Statistics of removed children are cleared in their parent, so they
+    # are searched again from scratch if selected later.
+    # NOTE: must not be called while nodes are pending.
+    def _evict(self, target):
+        candidates = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node._children:
+                for idx, child in node._children.items():
+                    candidates.append((child._visit_count, node, idx))
+                    stack.append(child)
+        candidates.sort(key=lambda candidate: candidate[0])
+
+        for _, parent, idx in candidates:
+            if self._node_count <= target:
+                break
+            # Parent is already removed together with its subtree.
+            if parent is not self._root and parent._parent is None:
+                continue
+            child = parent._children.pop(idx)
+            parent._child_visits[idx] = 0
+            parent._child_evals[idx] = 0
+            stack = [child]
+            while stack:
+                node = stack.pop()
+                node._parent = None
+                self._node_count -= 1
+                if node._children:
+                    stack.extend(node._children.values())
+            self._release(child)
+
+    # Run playouts from '_cur_node' until one of the budgets is used up:
+    # 'visit' playouts, 'seconds' of time or 'max_nodes' nodes in the tree,
+    # None is no limit. If 'early_stop', the search also stops once the
+    # best move can not be overtaken by the remaining playouts, with a time
+    # budget the remaining playouts are estimated from the speed so far.
+    # Leaves are collected 'batch_size' at a time and evaluated by the
+    # network in one call, virtual loss keeps the descents of a batch
+    # apart. batch_size=1 is the plain sequential search.
+    # Return the statistics of the search, see '_search_stats'.
+    def mcts_visit(self, visit=None, batch_size=1, seconds=None,
+                   max_nodes=None, early_stop=False):
+        self.stop_pondering()
+        return self._visit(visit, batch_size, seconds, max_nodes,
+                           early_stop)
+
+    # Search of 'mcts_visit', also run by the pondering thread.
+    def _visit(self, visit, batch_size, seconds, max_nodes, early_stop):
+        if visit is None and seconds is None and max_nodes is None:
+            raise ValueError('mcts_visit needs a search budget')
+        start = time.time()
+        deadline = None if seconds is None else start + seconds
         mcts_board = copy.deepcopy(self._board)
-        for _ in range(visit):
-            # Select until reach leaf or someone win.
-            leaf_node = self._select_until_leaf(mcts_board)
-            self._back_prop(leaf_node, mcts_board)
+        # Descents play on 'descent_board', which is timed if enabled.
+        descent_board = mcts_board
+        if self._stats is not None:
+            descent_board = search_stats.TimedBoard(mcts_board, self._stats)
+        timer = self._timer
+        DIMEN = bd.Board.BOARD_DIMEN
+        batch = np.empty((batch_size, DIMEN, DIMEN, 5), dtype=np.float32)
+        done = 0
+        while True:
+            stop_reason = self._stop_reason(done, visit, start, deadline,
+                                            max_nodes, early_stop)
+            if stop_reason is not None:
+                break
+            if (self._node_budget is not None and
+                    self._node_count >= self._node_budget):
+                if not self._evict_on_budget:
+                    stop_reason = 'node_budget'
+                    break
+                self._evict(int(self._node_budget * self.EVICT_RATIO))
+
+            leaves = []
+            keys = []
+            legal_points = []
+            proven = []
+            size = batch_size if visit is None else min(batch_size,
+                                                        visit - done)
+            for _ in range(size):
+                # Select until reach leaf or someone win.
+                with timer('select'):
+                    leaf_node = self._select_until_leaf(descent_board)
+                if leaf_node is None:
+                    # Run into a leaf which is already waiting for
+                    # evaluation, stop collecting and evaluate the batch.
+                    self._count('collisions')
+                    break
+
+                done += 1
+                if leaf_node.is_pending():
+                    with timer('tactics'):
+                        value, points = self._solve(mcts_board)
+                    if value is not None:
+                        leaf_node._nn_value = value
+                        self._count('proven')
+                else:
+                    # Game ended or proven before.
+                    self._count('terminal')
+                if not leaf_node.is_pending():
+                    # Game ended or proven, no need to ask the network.
+                    self._undo_until_current(leaf_node, descent_board)
+                    with timer('backprop'):
+                        self._back_prop(leaf_node)
+                    if leaf_node.proven_value() is not None:
+                        proven.append(leaf_node)
+                    continue
+
+                children = self._child_points(mcts_board, points)
+                with timer('transposition'):
+                    key = self._tt.key_of(mcts_board)
+                    entry = self._tt.lookup(*key)
+                if entry is not None:
+                    # Transposition, reuse the known result.
+                    self._count('tt_hits')
+                    leaf_node._nn_value = entry[1]
+                    with timer('expand'):
+                        self._expand(leaf_node, entry[0], children)
+                    self._undo_until_current(leaf_node, descent_board)
+                    with timer('backprop'):
+                        self._back_prop(leaf_node)
+                    continue
+
+                with timer('encode'):
+                    mcts_board.get_data_for_network(out=batch[len(leaves)])
+                leaves.append(leaf_node)
+                keys.append(key)
+                legal_points.append(children)
+                self._undo_until_current(leaf_node, descent_board)
 
-    # Keep select best child until reach leaf, and return it.
+            if leaves:
+                with timer('eval'):
+                    policies, values = self._network.evaluate(
+                        batch[:len(leaves)])
+                self._count('batches')
+                self._count('evaluated', len(leaves))
+                for idx, leaf_node in enumerate(leaves):
+                    with timer('transposition'):
+                        self._tt.store(*keys[idx], policies[idx],
+                                       values[idx])
+                    leaf_node._nn_value = values[idx]
+                    with timer('expand'):
+                        self._expand(leaf_node, policies[idx],
+                                     legal_points[idx])
+                    with timer('backprop'):
+                        self._back_prop(leaf_node)
+            # Nothing is pending now, so subtrees can be released.
+            with timer('backprop'):
+                self._propagate_proofs(proven)
+
+        self._count('playouts', done)
+        return self._search_stats(done, time.time() - start, stop_reason)
+
+    # Same as 'mcts_visit', but 'threads' threads search the tree at once.
+    # The tree is locked while a thread descends or updates it, virtual
+    # loss keeps the threads apart, and the leaves waiting for the network
+    # are evaluated together by a 'BatchedEvaluator'. The node budget
+    # stops the search, nodes are not evicted.
+    def mcts_visit_threaded(self, visit=None, threads=4, seconds=None,
+                            max_nodes=None, early_stop=False):
+        self.stop_pondering()
+        if visit is None and seconds is None and max_nodes is None:
+            raise ValueError('mcts_visit needs a search budget')
+        start = time.time()
+        deadline = None if seconds is None else start + seconds
+        state = {'done': 0, 'stop_reason': None, 'error': None}
+        proven = []
+        evaluator = BatchedEvaluator(self._network, threads)
+        workers = [threading.Thread(
+            target=self._search_thread,
+            args=(copy.deepcopy(self._board), state, proven, evaluator,
+                  (visit, start, deadline, max_nodes, early_stop)))
+            for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        evaluator.close()
+        if state['error'] is not None:
+            raise state['error']
+        # Nothing is pending now, so subtrees can be released.
+        self._propagate_proofs(proven)
+
+        self._count('playouts', state['done'])
+        return self._search_stats(state['done'], time.time() - start,
+                                  state['stop_reason'])
+
+    # Search loop of a thread of 'mcts_visit_threaded'. 'state' is shared
+    # by the threads, 'budget' are the arguments of '_stop_reason'.
+    def _search_thread(self, board, state, proven, evaluator, budget):
+        visit, start, deadline, max_nodes, early_stop = budget
+        try:
+            while True:
+                with self._lock:
+                    if state['stop_reason'] is None:
+                        state['stop_reason'] = self._stop_reason(
+                            state['done'], visit, start, deadline,
+                            max_nodes, early_stop)
+                    if (state['stop_reason'] is None and
+                            self._node_budget is not None and
+                            self._node_count >= self._node_budget):
+                        state['stop_reason'] = 'node_budget'
+                    if state['stop_reason'] is not None:
+                        return
+                    leaf = self._descend(board, state, proven)
+                if leaf is None:
+                    continue
+                if leaf is _COLLISION:
+                    # Run into a leaf which is waiting for evaluation.
+                    time.sleep(0)
+                    continue
+
+                leaf_node, data, key, children = leaf
+                policy, value = evaluator.evaluate(data)
+                with self._lock:
+                    self._tt.store(*key, policy, value)
+                    leaf_node._nn_value = value
+                    self._expand(leaf_node, policy, children)
+                    self._back_prop(leaf_node)
+        except Exception as e:
+            with self._lock:
+                state['error'] = e
+                state['stop_reason'] = 'error'
+
+    # One playout of a search thread, under '_lock'. Return [leaf, data,
+    # key, children] if the leaf needs the network, '_COLLISION' if the
+    # descent run into a pending leaf, or None if the playout is done.
+    def _descend(self, board, state, proven):
+        leaf_node = self._select_until_leaf(board)
+        if leaf_node is None:
+            self._count('collisions')
+            return _COLLISION
+
+        state['done'] += 1
+        if leaf_node.is_pending():
+            value, points = self._solve(board)
+            if value is not None:
+                leaf_node._nn_value = value
+        if not leaf_node.is_pending():
+            # Game ended or proven, no need to ask the network.
+            self._undo_until_current(leaf_node, board)
+            self._back_prop(leaf_node)
+            if leaf_node.proven_value() is not None:
+                proven.append(leaf_node)
+            return None
+
+        children = self._child_points(board, points)
+        key = self._tt.key_of(board)
+        entry = self._tt.lookup(*key)
+        if entry is not None:
+            # Transposition, reuse the known result.
+            leaf_node._nn_value = entry[1]
+            self._expand(leaf_node, entry[0], children)
+            self._undo_until_current(leaf_node, board)
+            self._back_prop(leaf_node)
+            return None
+
+        data = board.get_data_for_network()
+        self._undo_until_current(leaf_node, board)
+        return leaf_node, data, key, children
+
+    def _timer(self, phase):
+        if self._stats is None:
+            return search_stats.NO_TIMER
+        return self._stats.timer(phase)
+
+    def _count(self, name, value=1):
+        if self._stats is not None:
+            self._stats.count(name, value)
+
+    # Return why the search should stop, or None to go on.
+    def _stop_reason(self, done, visit, start, deadline, max_nodes,
+                     early_stop):
+        if visit is not None and done >= visit:
+            return 'playouts'
+        now = time.time()
+        # At least one batch is searched, so there is a move to play.
+        if deadline is not None and now >= deadline and done > 0:
+            return 'time'
+        if max_nodes is not None and self._node_count >= max_nodes:
+            return 'nodes'
+        if early_stop and (visit is not None or deadline is not None):
+            remaining = float('inf') if visit is None else visit - done
+            if deadline is not None and done > 0:
+                speed = done / max(now - start, 1e-6)
+                remaining = min(remaining, speed * (deadline - now))
+            if self._is_best_move_decided(remaining):
+                return 'decided'
+        return None
+
+    # Return True if 'remaining' more playouts can not change the most
+    # visited child of '_cur_node', which is the move of 'get_best_move'.
+    def _is_best_move_decided(self, remaining):
+        visits = self._cur_node._child_visits
+        if len(visits) == 0:
+            return False
+        if len(visits) == 1:
+            return visits[0] > 0
+        second, best = np.partition(visits, -2)[-2:]
+        return best - second > remaining
+
+    # 'stop_reason' is one of 'playouts', 'time', 'nodes', 'node_budget'
+    # and 'decided', the last one is an early stop. 'root_visits' are the
+    # playouts behind the move, including those of earlier searches and
+    # pondering which are kept in the reused subtree.
+    def _search_stats(self, playouts, seconds, stop_reason):
+        return {'playouts': playouts,
+                'root_visits': self._cur_node._visit_count,
+                'seconds': seconds,
+                'playouts_per_second': playouts / seconds if seconds > 0
+                else 0.0,
+                'nodes': self._node_count,
+                'stop_reason': stop_reason}
+
+    # Keep select best child until reach leaf or someone win, and return it.
+    # Virtual loss is added to every node on the way. The returned node is
+    # pending if it is a new leaf which needs network evaluation.
+    # Return None if the descent run into a leaf which is still pending,
+    # in this case the board and virtual loss are restored.
     def _select_until_leaf(self, board):
         cur_node = self._cur_node
         while True:
-            next_node_idx = cur_node.select_child()
-            next_node = cur_node._children[next_node_idx]
-            if type(next_node) is list:
-                someone_win = board.play(next_node[0], next_node[1])
-                new_node = self._create_node(cur_node._move + 1,
-                                             next_node[0], next_node[1],
-                                             next_node[2], board, cur_node)
+            next_node_idx = cur_node.select_child(self._c_puct)
+            next_node = cur_node._children.get(next_node_idx)
+            if next_node is None:
+                row, col = cur_node.child_move(next_node_idx)
+                someone_win = board.play(row, col)
+                new_node = Node(cur_node._move + 1, row, col,
+                                float(cur_node._child_priors[next_node_idx]),
+                                None, cur_node, next_node_idx)
                 cur_node._children[next_node_idx] = new_node
+                self._node_count += 1
+                new_node.add_virtual_loss(self.VIRTUAL_LOSS)
                 if someone_win == board.WIN:
                     new_node._nn_value = 1.0
                 elif someone_win == board.TIE:
@@ -134,66 +748,293 @@ class UctTree(object):
                 return new_node
 
             someone_win = board.play(next_node._row, next_node._col)
+            next_node.add_virtual_loss(self.VIRTUAL_LOSS)
             # Stop if someone win.
             if someone_win != board.NOTHING:
                 return next_node
 
+            if next_node.is_pending():
+                self._undo_until_current(next_node, board)
+                self._revert_path(next_node)
+                return None
+            if next_node._child_moves is None:
+                # Proven by tactics.
+                return next_node
+
             cur_node = next_node
 
-    def _back_prop(self, cur_node, board):
+    # Prove the ancestors of the proven leaves 'nodes' below '_cur_node'.
+    # A node loses if one of its children wins, and wins if all of its
+    # children lose and none was pruned. A proven node becomes a leaf with
+    # a fixed result and its children are released.
+    # NOTE: must not be called while nodes are pending.
+    def _propagate_proofs(self, nodes):
+        for node in nodes:
+            if not self._is_attached(node):
+                # Released by an earlier proof.
+                continue
+            while True:
+                value = node.proven_value()
+                parent = node._parent
+                if (value is None or parent is None or
+                        parent is self._cur_node or
+                        parent._child_moves is None):
+                    break
+                if value == 1.0:
+                    self._prove(parent, -1.0)
+                elif (not parent._pruned and
+                      len(parent._children) == len(parent._child_moves) and
+                      all(child.proven_value() == -1.0
+                          for child in parent._children.values())):
+                    self._prove(parent, 1.0)
+                else:
+                    break
+                node = parent
+
+    # Return True if 'node' is in the subtree of '_cur_node'.
+    def _is_attached(self, node):
+        while node is not None:
+            if node is self._cur_node:
+                return True
+            node = node._parent
+        return False
+
+    def _prove(self, node, value):
+        children = node._children
+        node._nn_value = value
+        node._child_moves = None
+        node._child_priors = None
+        node._child_visits = None
+        node._child_evals = None
+        node._children = None
+        for child in children.values():
+            child._parent = None
+            self._node_count -= child.subtree_size()
+            self._release(child)
+        # The proven result replaces the results so far.
+        node._mcts_eval = value * node._visit_count
+        node._parent._child_evals[node._index] = node._mcts_eval
+
+    # Undo the moves from 'cur_node' back to '_cur_node'.
+    def _undo_until_current(self, cur_node, board):
+        while cur_node is not self._cur_node:
+            board.undo(cur_node._row, cur_node._col)
+            cur_node = cur_node._parent
+
+    # Remove virtual loss along the path without updating result.
+    def _revert_path(self, cur_node):
+        while cur_node is not self._cur_node:
+            cur_node.revert_virtual_loss(self.VIRTUAL_LOSS)
+            cur_node = cur_node._parent
+
+    def _back_prop(self, cur_node):
         result_value = cur_node._nn_value
         while cur_node is not self._cur_node:
+            cur_node.revert_virtual_loss(self.VIRTUAL_LOSS)
             cur_node.update(result_value)
             result_value = -result_value
-            board.undo(cur_node._row, cur_node._col)
             cur_node = cur_node._parent
         cur_node.update(result_value)
 
-    def get_best_move(self):
-        best = 0
-        best_child = None
+    # Return [row, col] of the most visited child, or of the highest prior
+    # if no child is visited.
+    def get_best_move(self, verbose=True):
+        with self._lock:
+            best = 0
+            best_child = None
 
-        for child in self._cur_node._children:
-            if type(child) is Node:
+            for child in self._cur_node._children.values():
                 if child._visit_count > best:
                     best = child._visit_count
                     best_child = child
 
-        print('row: {}, col: {}, visit: {}, winrate: {}'
-              .format(best_child._row, best_child._col,
-                      best_child._visit_count, best_child._get_win_rate()))
-        return best_child._row, best_child._col
+            if best_child is None:
+                idx = int(np.argmax(self._cur_node._child_priors))
+                if verbose:
+                    print('no visits, prior: {}'.format(
+                        self._cur_node._child_priors[idx]))
+                return self._cur_node.child_move(idx)
+
+            if verbose:
+                print('row: {}, col: {}, visit: {}, winrate: {}'
+                      .format(best_child._row, best_child._col,
+                              best_child._visit_count,
+                              best_child._get_win_rate()))
+            return best_child._row, best_child._col
+
+    # Return [row, col] of a child sampled in proportion to its visit
+    # count, used to make self-play games different from each other.
+    # Sampled by prior if no child is visited.
+    def sample_move(self):
+        with self._lock:
+            weights = self._cur_node._child_visits.astype(np.float64)
+            if weights.sum() <= 0:
+                weights = self._cur_node._child_priors.astype(np.float64)
+            idx = np.random.choice(len(weights), p=weights / weights.sum())
+            return self._cur_node.child_move(idx)
+
+    def who_turn(self):
+        return self._board.who_turn()
+
+    def get_board(self):
+        return self._board
+
+    # Return visit count of every move of '_cur_node' indexed by point,
+    # 225 is PASS.
+    def get_visits(self):
+        visits = np.zeros(bd.Board.PASS_POINT + 1, dtype=np.float32)
+        with self._lock:
+            visits[self._cur_node._child_moves] = \
+                self._cur_node._child_visits
+        return visits
 
     def print_board(self):
         self._board.print_board()
 
     # Play at [row, col], if child node not exist then create it
-    # and move '_cur_node' to child node.
+    # and move '_cur_node' to child node. The child becomes the new root,
+    # its siblings and ancestors are released.
     # Return game status.
     def play(self, row, col):
+        self.stop_pondering()
         win = self._board.play(row, col)
         if win != bd.Board.NOTHING:
             print('End game')
             return win
 
-        # Find the next move's child.
-        for idx, child in enumerate(self._cur_node._children):
-            if type(child) is Node:
-                if child._row == row and child._col == col:
-                    self._cur_node = child
-                    return win
-            else:
-                if child[0] == row and child[1] == col:
-                    new_node = self._create_node(self._cur_node._move + 1,
-                                                 row, col, child[2],
-                                                 self._board, self._cur_node)
-                    # Append new child.
-                    self._cur_node._children[idx] = new_node
-                    self._cur_node = new_node
-
-                    return win
-
-        print('ERROR')
+        # Find the next move's child. It may not exist if the moves were
+        # restricted by tactics, or be a leaf proven by tactics.
+        idx = self._cur_node.find_child(row, col)
+        child = None
+        prior = 0.0
+        if idx != -1:
+            child = self._cur_node._children.pop(idx, None)
+            prior = float(self._cur_node._child_priors[idx])
+        if child is None or child._child_moves is None:
+            child = self._create_node(self._cur_node._move + 1, row, col,
+                                      prior, self._board, None)
+        child._parent = None
+
+        old_root = self._root
+        self._root = self._cur_node = child
+        self._node_count = child.subtree_size()
+        self._release(old_root)
+        return win
 
     def predict_current(self):
-        return self._network.output_value(self._board.get_data_for_network())
+        with self._lock:
+            _, value = self._evaluate(self._board)
+        return value
+
+    # Mix Dirichlet noise into the priors of the moves of '_cur_node', so
+    # searches of the same position differ, e.g. in a root parallel search.
+    def add_root_noise(self, alpha=0.3, fraction=0.25):
+        with self._lock:
+            priors = self._cur_node._child_priors
+            noise = np.random.dirichlet([alpha] * len(priors))
+            priors *= 1 - fraction
+            priors += (fraction * noise).astype(priors.dtype)
+
+    # Search from '_cur_node' in a background thread until
+    # 'stop_pondering', e.g. while the opponent thinks. The search runs in
+    # rounds of 'PONDER_SECONDS' under '_lock', which the methods reading
+    # the tree also take. Methods changing the tree, 'mcts_visit', 'play'
+    # and 'restart', stop pondering first, so the subtree of the played
+    # move is kept.
+    def start_pondering(self, batch_size=1):
+        self.stop_pondering()
+        self._ponder_stop.clear()
+        self._ponder_stats = {'playouts': 0, 'seconds': 0.0}
+        self._ponder_thread = threading.Thread(target=self._ponder,
+                                               args=(batch_size,),
+                                               daemon=True)
+        self._ponder_thread.start()
+
+    def _ponder(self, batch_size):
+        try:
+            while not self._ponder_stop.is_set():
+                with self._lock:
+                    stats = self._visit(None, batch_size,
+                                        self.PONDER_SECONDS, None, False)
+                self._ponder_stats['playouts'] += stats['playouts']
+                self._ponder_stats['seconds'] += stats['seconds']
+                if stats['stop_reason'] == 'node_budget':
+                    break
+        except Exception as e:
+            self._ponder_error = e
+
+    # Stop the background search, and return its {'playouts', 'seconds'}
+    # or None if not pondering. An error of the search is raised here.
+    def stop_pondering(self):
+        if self._ponder_thread is None:
+            return None
+        self._ponder_stop.set()
+        self._ponder_thread.join()
+        self._ponder_thread = None
+        error, self._ponder_error = self._ponder_error, None
+        if error is not None:
+            raise error
+        return self._ponder_stats
+
+    def is_pondering(self):
+        return self._ponder_thread is not None
+
+    # Hits and misses of the transposition table since the last reset,
+    # each miss is one network evaluation. Also the size and memory use.
+    def get_tt_stats(self):
+        return self._tt.get_stats()
+
+    def reset_tt_stats(self):
+        self._tt.reset_stats()
+
+    def clear_tt(self):
+        with self._lock:
+            self._tt.clear()
+            self._tt.reset_stats()
+
+    # Counters and phase times of the searches since the last reset,
+    # see 'SearchStats'. None if not 'instrument'.
+    def get_search_stats(self):
+        if self._stats is None:
+            return None
+        return self._stats.to_dict()
+
+    def reset_search_stats(self):
+        if self._stats is not None:
+            self._stats.reset()
+
+    # Shape of the tree below '_cur_node'. 'expanded' nodes have moves,
+    # 'branching' is their mean number of moves and 'created' their mean
+    # number of created children.
+    def get_tree_stats(self):
+        with self._lock:
+            nodes = 0
+            expanded = 0
+            moves = 0
+            created = 0
+            max_depth = 0
+            stack = [(self._cur_node, 0)]
+            while stack:
+                node, depth = stack.pop()
+                nodes += 1
+                max_depth = max(max_depth, depth)
+                if node._child_moves is None:
+                    continue
+                expanded += 1
+                moves += len(node._child_moves)
+                if node._children:
+                    created += len(node._children)
+                    stack.extend((child, depth + 1)
+                                 for child in node._children.values())
+            return {'nodes': nodes,
+                    'max_depth': max_depth,
+                    'expanded': expanded,
+                    'branching': moves / expanded if expanded else 0.0,
+                    'created': created / expanded if expanded else 0.0}
+
+    # Return {'search', 'tree', 'cache'} stats, see 'get_search_stats',
+    # 'get_tree_stats' and 'get_tt_stats'.
+    def get_stats(self):
+        return {'search': self.get_search_stats(),
+                'tree': self.get_tree_stats(),
+                'cache': self.get_tt_stats()}
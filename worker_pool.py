@@ -0,0 +1,82 @@
+import multiprocessing as mp
+import queue
+import signal
+import time
+
+
+# Worker processes for self-play and the arena. Tasks are put into
+# 'task_queue', every worker takes them until it gets None or
+# 'stop_event' is set, and sends its results to 'result_queue'.
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+# Worker process, runs 'target' and sends None when it is done.
+def _run_worker(target, worker_id, task_queue, result_queue, stop_event,
+                args):
+    # Only the main process handles Ctrl-C, workers stop by 'stop_event'.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try:
+        target(worker_id, task_queue, result_queue, stop_event, *args)
+    finally:
+        result_queue.put(None)
+
+
+class WorkerPool(object):
+    # 'workers' processes, each runs
+    # 'target(worker_id, task_queue, result_queue, stop_event, *args)'.
+    # 'target' must be a module function, the processes are spawned.
+    def __init__(self, target, workers, *args):
+        # SIGTERM stops the workers cleanly, same as Ctrl-C.
+        signal.signal(signal.SIGTERM, _interrupt)
+        ctx = mp.get_context('spawn')
+        self.task_queue = ctx.Queue()
+        self._result_queue = ctx.Queue()
+        self._stop_event = ctx.Event()
+        self._workers = [ctx.Process(target=_run_worker,
+                                     args=(target, i, self.task_queue,
+                                           self._result_queue,
+                                           self._stop_event, args))
+                         for i in range(workers)]
+        self._running = 0
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+        self._running = len(self._workers)
+
+    # No more tasks, every worker stops after the tasks already queued.
+    def finish(self):
+        for _ in self._workers:
+            self.task_queue.put(None)
+
+    # Yield the results until every worker is done.
+    def results(self):
+        while self._running > 0:
+            result = self._result_queue.get()
+            if result is None:
+                self._running -= 1
+                continue
+            yield result
+
+    # Stop the workers, tasks in progress are dropped.
+    def close(self):
+        self._stop_event.set()
+        # Workers stop after the current move, drain their results so
+        # they are not blocked on a full queue. Killed workers never send
+        # None, so the drain also ends once all of them exited.
+        deadline = time.time() + 60
+        while (self._running > 0 and time.time() < deadline and
+               any(worker.is_alive() for worker in self._workers)):
+            try:
+                if self._result_queue.get(timeout=1) is None:
+                    self._running -= 1
+            except queue.Empty:
+                pass
+        for worker in self._workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()